@@ -45,7 +45,10 @@ def get_database_url():
     database_url = os.getenv("DATABASE_URL")
     
     if database_url:
-        return database_url
+        # L'application utilise un driver async, Alembic tourne en synchrone
+        return (database_url
+                .replace("+aiosqlite", "")
+                .replace("+asyncpg", "+psycopg2"))
     
     # Priorité 2: Chemin depuis variable d'environnement
     database_path = os.getenv("DATABASE_PATH", "database.db")
@@ -64,6 +67,12 @@ def include_object(object, name, type_, reflected, compare_to):
     # Exclure la table alembic_version (gérée automatiquement)
     if type_ == "table" and name == "alembic_version":
         return False
+
+    # Index plein texte (table FTS5 et ses tables internes, index GIN) : migrations manuelles
+    if type_ == "table" and name.startswith("message_fts"):
+        return False
+    if type_ == "index" and name == "ix_message_content_fts":
+        return False
         
     return True
 
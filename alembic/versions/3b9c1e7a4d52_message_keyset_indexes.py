@@ -0,0 +1,46 @@
+"""Message conversation key and keyset pagination indexes
+
+Revision ID: 3b9c1e7a4d52
+Revises: df0edf36bf7a
+Create Date: 2026-10-17 09:12:41.208311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9c1e7a4d52'
+down_revision: Union[str, Sequence[str], None] = 'df0edf36bf7a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_key', sa.String(length=50), nullable=True))
+
+    # Remplir la clé normalisée "min:max" pour les messages existants
+    op.execute(
+        "UPDATE message SET conversation_key = CASE "
+        "WHEN sender_id <= receiver_id "
+        "THEN CAST(sender_id AS VARCHAR) || ':' || CAST(receiver_id AS VARCHAR) "
+        "ELSE CAST(receiver_id AS VARCHAR) || ':' || CAST(sender_id AS VARCHAR) END"
+    )
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_conversation_created', ['conversation_key', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_message_sender_created', ['sender_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_message_receiver_created', ['receiver_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_receiver_created')
+        batch_op.drop_index('ix_message_sender_created')
+        batch_op.drop_index('ix_message_conversation_created')
+        batch_op.drop_column('conversation_key')
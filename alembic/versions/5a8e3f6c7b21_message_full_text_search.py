@@ -0,0 +1,44 @@
+"""Full-text search index on message content
+
+Revision ID: 5a8e3f6c7b21
+Revises: e7b05a93d2f1
+Create Date: 2026-10-17 13:41:26.907152
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a8e3f6c7b21'
+down_revision: Union[str, Sequence[str], None] = 'e7b05a93d2f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "sqlite":
+        # Table FTS5 autonome (rowid = id du message), remplie avec l'existant
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts "
+            "USING fts5(content, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "INSERT INTO message_fts (rowid, content) SELECT id, content FROM message "
+            "WHERE id NOT IN (SELECT rowid FROM message_fts)"
+        )
+    else:
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_message_content_fts "
+            "ON message USING gin (to_tsvector('simple', content))"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("DROP TABLE IF EXISTS message_fts")
+    else:
+        op.execute("DROP INDEX IF EXISTS ix_message_content_fts")
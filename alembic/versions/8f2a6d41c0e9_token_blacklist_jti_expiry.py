@@ -0,0 +1,76 @@
+"""Token blacklist keyed by jti with expiry
+
+Revision ID: 8f2a6d41c0e9
+Revises: 3b9c1e7a4d52
+Create Date: 2026-10-17 10:03:17.552904
+
+"""
+import base64
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2a6d41c0e9'
+down_revision: Union[str, Sequence[str], None] = '3b9c1e7a4d52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _token_claims(token: str) -> dict:
+    """Lit les claims d'un JWT sans vérifier la signature (le token a déjà été validé au logout)"""
+    payload = token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('tokenblacklist', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('jti', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('expires_at', sa.DateTime(), nullable=True))
+
+    # Convertir les lignes existantes : jti (ou empreinte du token) + expiration
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, token FROM tokenblacklist")).fetchall()
+    for row_id, token in rows:
+        try:
+            claims = _token_claims(token)
+            expires_at = datetime.fromtimestamp(claims["exp"], timezone.utc).replace(tzinfo=None)
+        except (IndexError, KeyError, ValueError):
+            conn.execute(sa.text("DELETE FROM tokenblacklist WHERE id = :id"), {"id": row_id})
+            continue
+        jti = claims.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+        conn.execute(
+            sa.text("UPDATE tokenblacklist SET jti = :jti, expires_at = :expires_at WHERE id = :id"),
+            {"jti": jti, "expires_at": expires_at, "id": row_id}
+        )
+
+    with op.batch_alter_table('tokenblacklist', schema=None) as batch_op:
+        batch_op.drop_index('ix_tokenblacklist_token')
+        batch_op.drop_column('token')
+        batch_op.alter_column('jti', existing_type=sa.String(length=64), nullable=False)
+        batch_op.alter_column('expires_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index('ix_tokenblacklist_jti', ['jti'], unique=True)
+        batch_op.create_index('ix_tokenblacklist_expires_at', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Les tokens complets ne sont plus connus : le jti est conservé à leur place
+    with op.batch_alter_table('tokenblacklist', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token', sa.VARCHAR(), nullable=True))
+
+    op.execute("UPDATE tokenblacklist SET token = jti")
+
+    with op.batch_alter_table('tokenblacklist', schema=None) as batch_op:
+        batch_op.drop_index('ix_tokenblacklist_expires_at')
+        batch_op.drop_index('ix_tokenblacklist_jti')
+        batch_op.alter_column('token', existing_type=sa.VARCHAR(), nullable=False)
+        batch_op.create_index('ix_tokenblacklist_token', ['token'], unique=True)
+        batch_op.drop_column('expires_at')
+        batch_op.drop_column('jti')
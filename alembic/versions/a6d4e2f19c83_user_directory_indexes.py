@@ -0,0 +1,30 @@
+"""Case-insensitive prefix indexes for the user directory
+
+Revision ID: a6d4e2f19c83
+Revises: f3c9a1d27b64
+Create Date: 2026-10-17 17:20:44.613905
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d4e2f19c83'
+down_revision: Union[str, Sequence[str], None] = 'f3c9a1d27b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_user_name_lower', 'user', [sa.text('lower(name)')], unique=False)
+    op.create_index('ix_user_email_lower', 'user', [sa.text('lower(email)')], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_email_lower', table_name='user')
+    op.drop_index('ix_user_name_lower', table_name='user')
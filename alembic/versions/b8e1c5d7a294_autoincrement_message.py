@@ -0,0 +1,36 @@
+"""Never reuse message ids (SQLite AUTOINCREMENT)
+
+Revision ID: b8e1c5d7a294
+Revises: a6d4e2f19c83
+Create Date: 2026-10-17 18:02:37.551904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e1c5d7a294'
+down_revision: Union[str, Sequence[str], None] = 'a6d4e2f19c83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Sans AUTOINCREMENT, SQLite réattribue le plus grand id après sa suppression.
+    # Seul SQLite est concerné (les séquences PostgreSQL ne reculent jamais) ;
+    # la table est recréée, les ids existants sont conservés
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('message', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+        pass
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('message', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+        pass
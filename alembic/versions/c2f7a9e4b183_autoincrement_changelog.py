@@ -0,0 +1,37 @@
+"""Never move the changelog sequence backwards (SQLite AUTOINCREMENT)
+
+Revision ID: c2f7a9e4b183
+Revises: b8e1c5d7a294
+Create Date: 2026-10-17 18:09:12.804316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f7a9e4b183'
+down_revision: Union[str, Sequence[str], None] = 'b8e1c5d7a294'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Sans AUTOINCREMENT, la séquence du journal repartirait du plus grand id restant
+    # après une purge.
+    # Seul SQLite est concerné (les séquences PostgreSQL ne reculent jamais) ;
+    # la table est recréée, les ids existants sont conservés
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('changelog', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+        pass
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('changelog', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+        pass
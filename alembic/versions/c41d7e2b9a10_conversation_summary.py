@@ -0,0 +1,70 @@
+"""Conversation summary table for the inbox
+
+Revision ID: c41d7e2b9a10
+Revises: 8f2a6d41c0e9
+Create Date: 2026-10-17 11:20:05.114873
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d7e2b9a10'
+down_revision: Union[str, Sequence[str], None] = '8f2a6d41c0e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    summary = op.create_table(
+        'conversationsummary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('other_user_id', sa.Integer(), nullable=False),
+        sa.Column('conversation_key', sa.String(length=50), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=True),
+        sa.Column('last_sender_id', sa.Integer(), nullable=True),
+        sa.Column('last_message_preview', sa.String(length=100), nullable=True),
+        sa.Column('last_message_at', sa.DateTime(), nullable=True),
+        sa.Column('unread_count', sa.Integer(), nullable=False),
+        sa.Column('last_read_message_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['other_user_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'other_user_id', name='uq_conversationsummary_pair')
+    )
+    op.create_index('ix_conversationsummary_user_last', 'conversationsummary', ['user_id', 'last_message_at', 'id'], unique=False)
+
+    # Un résumé par participant et par conversation existante.
+    # Faute d'historique de lecture, les anciens messages sont considérés comme lus.
+    conn = op.get_bind()
+    latest = {}
+    rows = conn.execute(sa.text(
+        "SELECT id, sender_id, receiver_id, conversation_key, content, created_at "
+        "FROM message ORDER BY created_at, id"
+    ).columns(created_at=sa.DateTime()))
+    for message_id, sender_id, receiver_id, conversation_key, content, created_at in rows:
+        for user_id, other_user_id in ((sender_id, receiver_id), (receiver_id, sender_id)):
+            latest[(user_id, other_user_id)] = {
+                'user_id': user_id,
+                'other_user_id': other_user_id,
+                'conversation_key': conversation_key,
+                'last_message_id': message_id,
+                'last_sender_id': sender_id,
+                'last_message_preview': content[:100],
+                'last_message_at': created_at,
+                'unread_count': 0,
+                'last_read_message_id': message_id,
+            }
+    if latest:
+        op.bulk_insert(summary, list(latest.values()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_conversationsummary_user_last', table_name='conversationsummary')
+    op.drop_table('conversationsummary')
@@ -0,0 +1,44 @@
+"""Change log for incremental client sync
+
+Revision ID: e7b05a93d2f1
+Revises: c41d7e2b9a10
+Create Date: 2026-10-17 12:02:48.630917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b05a93d2f1'
+down_revision: Union[str, Sequence[str], None] = 'c41d7e2b9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'changelog',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_type', sa.String(length=30), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=True),
+        sa.Column('sender_id', sa.Integer(), nullable=False),
+        sa.Column('receiver_id', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_changelog_sender_seq', 'changelog', ['sender_id', 'id'], unique=False)
+    op.create_index('ix_changelog_receiver_seq', 'changelog', ['receiver_id', 'id'], unique=False)
+    op.create_index(op.f('ix_changelog_created_at'), 'changelog', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_changelog_created_at'), table_name='changelog')
+    op.drop_index('ix_changelog_receiver_seq', table_name='changelog')
+    op.drop_index('ix_changelog_sender_seq', table_name='changelog')
+    op.drop_table('changelog')
@@ -0,0 +1,92 @@
+"""Group conversations and memberships
+
+Revision ID: f3c9a1d27b64
+Revises: 5a8e3f6c7b21
+Create Date: 2026-10-17 16:05:12.418230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c9a1d27b64'
+down_revision: Union[str, Sequence[str], None] = '5a8e3f6c7b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'conversation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('created_by', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'membership',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('joined_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversation.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('conversation_id', 'user_id', name='uq_membership_conversation_user')
+    )
+    op.create_index('ix_membership_user', 'membership', ['user_id', 'conversation_id'], unique=False)
+
+    # Message de groupe : conversation_id renseigné, receiver_id vide
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+        batch_op.alter_column('receiver_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.create_foreign_key('fk_message_conversation_id', 'conversation', ['conversation_id'], ['id'])
+        batch_op.create_index('ix_message_group_created', ['conversation_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('conversationsummary', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+        batch_op.alter_column('other_user_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.create_foreign_key('fk_conversationsummary_conversation_id', 'conversation', ['conversation_id'], ['id'])
+        batch_op.create_index('ix_conversationsummary_key', ['conversation_key', 'user_id'], unique=False)
+
+    with op.batch_alter_table('changelog', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+        batch_op.alter_column('receiver_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.create_index('ix_changelog_conversation_seq', ['conversation_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Les données de groupe n'ont pas de représentation dans l'ancien schéma
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("DELETE FROM message_fts WHERE rowid IN (SELECT id FROM message WHERE conversation_id IS NOT NULL)")
+    op.execute("DELETE FROM changelog WHERE conversation_id IS NOT NULL")
+    op.execute("DELETE FROM conversationsummary WHERE conversation_id IS NOT NULL")
+    op.execute("DELETE FROM message WHERE conversation_id IS NOT NULL")
+
+    with op.batch_alter_table('changelog', schema=None) as batch_op:
+        batch_op.drop_index('ix_changelog_conversation_seq')
+        batch_op.alter_column('receiver_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('conversation_id')
+
+    with op.batch_alter_table('conversationsummary', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversationsummary_key')
+        batch_op.drop_constraint('fk_conversationsummary_conversation_id', type_='foreignkey')
+        batch_op.alter_column('other_user_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('conversation_id')
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_group_created')
+        batch_op.drop_constraint('fk_message_conversation_id', type_='foreignkey')
+        batch_op.alter_column('receiver_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('conversation_id')
+
+    op.drop_index('ix_membership_user', table_name='membership')
+    op.drop_table('membership')
+    op.drop_table('conversation')
@@ -0,0 +1,123 @@
+"""
+Benchmark de la sérialisation des listes (GET /user/, pages de messages).
+
+Compare, sur une base SQLite temporaire de N lignes, en processus (sans HTTP) :
+
+    orm     chemin d'origine : objets User / Message chargés par l'ORM, puis
+            validés et sérialisés par FastAPI via le response_model
+    tuples  chemin actuel : colonnes lues en tuples, encodées par FastJSONResponse
+
+Résultat en JSON (lignes par seconde, meilleure de --repeat mesures, et
+vérification que les deux chemins renvoient le même document JSON) sur la sortie standard.
+
+    python benchmarks/list_serialization.py --rows 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from harness import ROOT
+
+
+async def run(rows: int, repeat: int) -> dict:
+    # Modules de l'application importés une fois la base temporaire configurée
+    sys.path.insert(0, ROOT)
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from sqlmodel import SQLModel, insert, select
+    import database
+    from models import Message, MessagePage, User, UserPage
+    from routers.message import encode_cursor, paginate_messages
+    from routers.user import read_users
+
+    async with database.engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        now = datetime.utcnow()
+        await conn.execute(insert(User), [
+            {"name": f"user{i}", "email": f"user{i}@example.com", "password": "x"} for i in range(rows)
+        ])
+        await conn.execute(insert(Message), [
+            {"content": f"message {i} " * 4, "timestamp": now, "created_at": now,
+             "sender_id": 1, "receiver_id": 2, "conversation_key": "1:2"}
+            for i in range(rows)
+        ])
+
+    users_field = create_model_field(name="Response", type_=UserPage, mode="serialization")
+    page_field = create_model_field(name="Response", type_=MessagePage, mode="serialization")
+
+    async def users_orm(session):
+        users = (await session.exec(select(User).order_by(User.id).limit(rows + 1))).all()
+        content = await serialize_response(field=users_field, response_content=UserPage(items=users), is_coroutine=True)
+        return JSONResponse(content).body
+
+    async def users_tuples(session):
+        response = await read_users(
+            q=None, after=None, limit=rows, if_none_match=None, session=session, current_user=None
+        )
+        return response.body
+
+    async def messages_orm(session):
+        query = select(Message).where(Message.conversation_key == "1:2")
+        query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(rows)
+        messages = list((await session.exec(query)).all())
+        messages.reverse()
+        page = MessagePage(items=messages, after=encode_cursor(messages[-1]))
+        content = await serialize_response(field=page_field, response_content=page, is_coroutine=True)
+        return JSONResponse(content).body
+
+    async def messages_tuples(session):
+        response = await paginate_messages(session, Message.conversation_key == "1:2", None, None, rows)
+        return response.body
+
+    async def measure(path):
+        best, body = None, b""
+        for _ in range(repeat):
+            # Session neuve à chaque mesure : pas d'objets déjà dans l'identity map
+            async with database.async_session() as session:
+                start = time.perf_counter()
+                body = await path(session)
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return {"seconds": round(best, 3), "rows_per_second": round(rows / best), "bytes": len(body)}, body
+
+    results = {}
+    for name, before, after in (("users", users_orm, users_tuples), ("messages", messages_orm, messages_tuples)):
+        (orm, orm_body), (tuples, tuples_body) = await measure(before), await measure(after)
+        results[name] = {
+            "orm": orm,
+            "tuples": tuples,
+            "speedup": round(orm["seconds"] / tuples["seconds"], 1),
+            # Même document JSON (l'ordre des clés des objets ORM n'est pas garanti)
+            "same_output": json.loads(orm_body) == json.loads(tuples_body),
+        }
+    await database.engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        results = asyncio.run(run(args.rows, args.repeat))
+
+    try:
+        import orjson  # noqa: F401
+        results["encoder"] = "orjson"
+    except ImportError:
+        results["encoder"] = "json"
+    results["config"] = vars(args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Banc de charge de bout en bout.
+
+Lance l'application (uvicorn, base SQLite temporaire), inscrit N utilisateurs et
+M messages, puis enchaîne des scénarios de durée fixe :
+
+    chat      clients WebSocket sur /message/ws qui s'envoient des messages
+              (latence d'acquittement et de livraison au destinataire)
+    history   lectures concurrentes de /message/conversation/{id}
+    login     rafale de connexions sur /auth/token (bcrypt)
+    presence  connexions / déconnexions répétées sur /user/ws/{token},
+              observées par des clients abonnés à leur présence
+
+Résultat en JSON (débit, p50, p99) sur la sortie standard, et dans --output.
+
+    python benchmarks/load.py --users 50 --messages 2000 --duration 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import httpx
+import websockets
+
+from harness import app_server, login, register, summarize, wait_ready
+
+SCENARIOS = ("chat", "history", "login", "presence")
+
+
+class Bench:
+    def __init__(self, base_url: str, args):
+        self.base_url = base_url
+        self.ws_url = base_url.replace("http://", "ws://", 1)
+        self.args = args
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=60)
+        self.tokens = []
+        self.user_ids = []
+
+    async def gather_limited(self, coroutines, limit: int):
+        semaphore = asyncio.Semaphore(limit)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
+
+    def headers(self, index: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[index]}"}
+
+    # --- Données initiales ---
+
+    async def seed(self) -> dict:
+        start = time.perf_counter()
+        self.tokens = await self.gather_limited((register(self.client, i) for i in range(self.args.users)), 8)
+        users = await asyncio.gather(*(self.client.get("/auth/me", headers=self.headers(i)) for i in range(len(self.tokens))))
+        self.user_ids = [user.json()["id"] for user in users]
+        users_time = time.perf_counter() - start
+
+        # Messages répartis sur des conversations i -> i + 1, pour que l'historique ait du contenu
+        start = time.perf_counter()
+        await self.gather_limited((self.post_message(i % self.args.users, i) for i in range(self.args.messages)), 16)
+        messages_time = time.perf_counter() - start
+        return {
+            "users": self.args.users,
+            "users_seconds": round(users_time, 2),
+            "messages": self.args.messages,
+            "messages_per_second": round(self.args.messages / messages_time, 1) if messages_time else None,
+        }
+
+    async def post_message(self, sender: int, index: int):
+        receiver = self.user_ids[(sender + 1) % len(self.user_ids)]
+        await self.client.post(
+            "/message/", params={"receiver_id": receiver, "content": f"seed {index}"}, headers=self.headers(sender)
+        )
+
+    # --- Scénarios ---
+
+    async def chat(self, duration: float) -> dict:
+        """Chaque client envoie à son voisin et attend l'acquittement avant le message suivant"""
+        count = min(self.args.ws_clients, len(self.tokens))
+        ack_latencies, delivery_latencies = [], []
+        sent_at = {}
+        client_ids = itertools.count()
+        sockets = [
+            await websockets.connect(f"{self.ws_url}/message/ws?token={self.tokens[i]}") for i in range(count)
+        ]
+        pending_acks = [dict() for _ in range(count)]
+
+        async def reader(index: int):
+            async for raw in sockets[index]:
+                data = json.loads(raw)
+                if data["type"] == "ping":
+                    await sockets[index].send(json.dumps({"type": "pong"}))
+                elif data["type"] == "message_ack":
+                    future = pending_acks[index].pop(data["client_id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(None)
+                elif data["type"] == "new_message" and data["receiver_id"] == self.user_ids[index]:
+                    start = sent_at.pop(data["content"], None)
+                    if start is not None:
+                        delivery_latencies.append(time.perf_counter() - start)
+
+        async def sender(index: int, stop_at: float):
+            receiver = self.user_ids[(index + 1) % count]
+            while time.monotonic() < stop_at:
+                client_id = f"c{next(client_ids)}"
+                future = asyncio.get_running_loop().create_future()
+                pending_acks[index][client_id] = future
+                start = sent_at[client_id] = time.perf_counter()
+                await sockets[index].send(json.dumps({
+                    "type": "send_message", "receiver_id": receiver, "content": client_id, "client_id": client_id
+                }))
+                await asyncio.wait_for(future, timeout=30)
+                ack_latencies.append(time.perf_counter() - start)
+
+        readers = [asyncio.create_task(reader(i)) for i in range(count)]
+        stop_at = time.monotonic() + duration
+        await asyncio.gather(*(sender(i, stop_at) for i in range(count)))
+        # Laisser arriver les dernières livraisons
+        await asyncio.sleep(0.5)
+        for socket in sockets:
+            await socket.close()
+        await asyncio.gather(*readers, return_exceptions=True)
+        return {"clients": count, "ack": summarize(ack_latencies, duration), "delivery": summarize(delivery_latencies, duration)}
+
+    async def history(self, duration: float) -> dict:
+        latencies, errors = [], 0
+        stop_at = time.monotonic() + duration
+
+        async def reader(index: int):
+            nonlocal errors
+            sender = index % len(self.tokens)
+            peer = self.user_ids[(sender + 1) % len(self.user_ids)]
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                response = await self.client.get(f"/message/conversation/{peer}", headers=self.headers(sender))
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(reader(i) for i in range(self.args.readers)))
+        return {"readers": self.args.readers, "errors": errors, **summarize(latencies, duration)}
+
+    async def login(self, duration: float) -> dict:
+        latencies, rejected = [], 0
+        stop_at = time.monotonic() + duration
+
+        async def loginer(index: int):
+            nonlocal rejected
+            email = f"bench{index % len(self.tokens)}@example.com"
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                try:
+                    await login(self.client, email)
+                    latencies.append(time.perf_counter() - start)
+                except (KeyError, ValueError):
+                    # 503 du pool bcrypt saturé
+                    rejected += 1
+                    await asyncio.sleep(0.05)
+
+        await asyncio.gather(*(loginer(i) for i in range(self.args.logins)))
+        return {"clients": self.args.logins, "rejected": rejected, **summarize(latencies, duration)}
+
+    async def presence(self, duration: float) -> dict:
+        """Des utilisateurs se connectent et se déconnectent en boucle ; des observateurs suivent leur statut"""
+        churners = min(self.args.churners, len(self.tokens) - 1)
+        observers = min(self.args.observers, len(self.tokens) - churners)
+        watched = self.user_ids[:churners]
+        connect_latencies = []
+        status_events = 0
+
+        observer_sockets = []
+        for i in range(churners, churners + observers):
+            socket = await websockets.connect(f"{self.ws_url}/user/ws/{self.tokens[i]}")
+            await socket.recv()
+            await socket.send(json.dumps({"type": "subscribe_presence", "user_ids": watched}))
+            await socket.recv()
+            observer_sockets.append(socket)
+
+        async def observer(socket):
+            nonlocal status_events
+            async for raw in socket:
+                data = json.loads(raw)
+                if data["type"] == "ping":
+                    await socket.send(json.dumps({"type": "pong"}))
+                elif data["type"] == "user_status":
+                    status_events += 1
+
+        async def churner(index: int, stop_at: float):
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                async with websockets.connect(f"{self.ws_url}/user/ws/{self.tokens[index]}") as socket:
+                    # Première trame : liste des utilisateurs actifs
+                    await socket.recv()
+                    connect_latencies.append(time.perf_counter() - start)
+                    await asyncio.sleep(0.05)
+
+        observer_tasks = [asyncio.create_task(observer(socket)) for socket in observer_sockets]
+        stop_at = time.monotonic() + duration
+        await asyncio.gather(*(churner(i, stop_at) for i in range(churners)))
+        await asyncio.sleep(1)
+        for socket in observer_sockets:
+            await socket.close()
+        await asyncio.gather(*observer_tasks, return_exceptions=True)
+        return {
+            "churners": churners,
+            "observers": observers,
+            "status_events": status_events,
+            "connect": summarize(connect_latencies, duration),
+        }
+
+    async def run(self) -> dict:
+        await wait_ready(self.client)
+        results = {"seed": await self.seed()}
+        for name in self.args.scenarios:
+            results[name] = await getattr(self, name)(self.args.duration)
+        await self.client.aclose()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=10, help="durée de chaque scénario (secondes)")
+    parser.add_argument("--ws-clients", type=int, default=20)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--logins", type=int, default=16)
+    parser.add_argument("--churners", type=int, default=10)
+    parser.add_argument("--observers", type=int, default=5)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--output", help="fichier JSON où écrire aussi le résultat")
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users doit être au moins 2")
+
+    with app_server() as base_url:
+        results = asyncio.run(Bench(base_url, args).run())
+    results["config"] = {key: value for key, value in vars(args).items() if key != "output"}
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark du profil SQLite sur les endpoints de messages.
+
+Lance l'application (uvicorn, base SQLite temporaire) une fois par profil,
+puis mesure en parallèle des écritures (POST /message/) et des lectures
+(GET /message/conversation/{id}). Résultat en JSON sur la sortie standard.
+
+    python benchmarks/sqlite_profile.py --writers 16 --readers 16 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from harness import app_server, register, summarize, wait_ready
+
+PROFILES = {
+    # Réglages SQLite par défaut (configuration d'origine, sans echo)
+    "default": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_CACHE_SIZE": "-2000",
+        "SQLITE_MMAP_SIZE": "0",
+    },
+    # Profil de production de database.py
+    "tuned": {},
+}
+
+
+async def run_load(base_url: str, writers: int, readers: int, duration: float):
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        await wait_ready(client)
+        tokens = await asyncio.gather(*(register(client, i) for i in range(writers + 1)))
+        me = await client.get("/auth/me", headers={"Authorization": f"Bearer {tokens[-1]}"})
+        peer_id = me.json()["id"]
+
+        write_latencies, read_latencies = [], []
+        stop_at = time.monotonic() + duration
+
+        async def writer(token):
+            headers = {"Authorization": f"Bearer {token}"}
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/message/", params={"receiver_id": peer_id, "content": "bench"}, headers=headers
+                )
+                if response.status_code == 200:
+                    write_latencies.append(time.perf_counter() - start)
+
+        async def reader(token):
+            headers = {"Authorization": f"Bearer {token}"}
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                response = await client.get(f"/message/conversation/{peer_id}", headers=headers)
+                if response.status_code == 200:
+                    read_latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(
+            *(writer(tokens[i]) for i in range(writers)),
+            *(reader(tokens[i % writers]) for i in range(readers)),
+        )
+        return {"writes": summarize(write_latencies, duration), "reads": summarize(read_latencies, duration)}
+
+
+def bench_profile(name: str, args) -> dict:
+    with app_server(PROFILES[name]) as base_url:
+        return asyncio.run(run_load(base_url, args.writers, args.readers, args.duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    results = {name: bench_profile(name, args) for name in args.profiles}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
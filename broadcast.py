@@ -0,0 +1,147 @@
+"""
+Backplane de diffusion entre processus.
+
+Le registre des connexions publie ses événements sur un canal ; chaque worker
+est abonné à ces canaux et livre l'événement aux WebSockets qu'il détient.
+Avec plusieurs workers uvicorn, il faut un backend partagé (Redis).
+
+La diffusion est au mieux : une publication qui échoue (Redis indisponible) est
+journalisée sans faire échouer la requête, dont l'écriture en base est déjà
+faite ; les clients rattrapent les messages manqués par resume_from / sync.
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List
+from metrics import Counter
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # dépendance optionnelle
+    aioredis = None
+
+Handler = Callable[[bytes], Awaitable[None]]
+
+# Délai (secondes) avant de se réabonner après une coupure ; doublé à chaque échec
+BROADCAST_RECONNECT_MIN = float(os.getenv("BROADCAST_RECONNECT_MIN", "0.5"))
+BROADCAST_RECONNECT_MAX = float(os.getenv("BROADCAST_RECONNECT_MAX", "30"))
+
+broadcast_errors = Counter("broadcast_errors_total", "Erreurs du backplane, par opération (publish, subscribe)")
+
+
+class BroadcastBackend:
+    """Interface commune des backends de diffusion"""
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = {}
+
+    def subscribe(self, channel: str, handler: Handler):
+        """Enregistre un handler appelé pour chaque message publié sur le canal"""
+        self.handlers.setdefault(channel, []).append(handler)
+
+    async def dispatch(self, channel: str, message: bytes):
+        for handler in self.handlers.get(channel, []):
+            try:
+                await handler(message)
+            except Exception as e:
+                print(f"Erreur handler broadcast ({channel}): {e}")
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def publish(self, channel: str, message: bytes) -> bool:
+        raise NotImplementedError
+
+
+class MemoryBackend(BroadcastBackend):
+    """Backend local au processus (un seul worker, développement)"""
+
+    async def publish(self, channel: str, message: bytes) -> bool:
+        await self.dispatch(channel, message)
+        return True
+
+
+class RedisBackend(BroadcastBackend):
+    """Backend Redis PUBLISH/SUBSCRIBE partagé par tous les workers"""
+
+    def __init__(self, url: str):
+        super().__init__()
+        if aioredis is None:
+            raise RuntimeError("Le backend Redis nécessite le paquet 'redis' (pip install redis)")
+        self.url = url
+        self.client = None
+        self.pubsub = None
+        self.reader_task = None
+
+    async def connect(self):
+        self.client = aioredis.from_url(self.url)
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(*self.handlers.keys())
+        self.reader_task = asyncio.create_task(self._reader())
+
+    async def disconnect(self):
+        if self.reader_task:
+            self.reader_task.cancel()
+        if self.pubsub:
+            await self.pubsub.aclose()
+        if self.client:
+            await self.client.aclose()
+
+    async def publish(self, channel: str, message: bytes) -> bool:
+        """Publie sans jamais lever : False si Redis n'a pas pu être joint"""
+        try:
+            await self.client.publish(channel, message)
+            return True
+        except Exception as e:
+            broadcast_errors.inc(operation="publish")
+            print(f"Erreur publication broadcast ({channel}): {e}")
+            return False
+
+    async def _reader(self):
+        """
+        Livre les messages reçus. Si la connexion tombe, se réabonne avec un délai
+        croissant ; les messages publiés pendant la coupure sont perdus pour ce worker
+        """
+        delay = BROADCAST_RECONNECT_MIN
+        while True:
+            try:
+                if self.pubsub is None:
+                    self.pubsub = self.client.pubsub()
+                    await self.pubsub.subscribe(*self.handlers.keys())
+                    print("Backplane Redis : réabonné")
+                    delay = BROADCAST_RECONNECT_MIN
+                async for item in self.pubsub.listen():
+                    if item["type"] != "message":
+                        continue
+                    await self.dispatch(item["channel"].decode(), item["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                broadcast_errors.inc(operation="subscribe")
+                print(f"Backplane Redis interrompu ({e}), nouvel essai dans {delay:g}s")
+            await self._drop_pubsub()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BROADCAST_RECONNECT_MAX)
+
+    async def _drop_pubsub(self):
+        pubsub, self.pubsub = self.pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+
+def create_backend(url: str) -> BroadcastBackend:
+    """Choisit le backend selon le schéma de l'URL (memory://, redis://, rediss://)"""
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    raise ValueError(f"Backend de diffusion inconnu : {url}")
+
+
+BROADCAST_URL = os.getenv("BROADCAST_URL", "memory://")
+broadcast = create_backend(BROADCAST_URL)
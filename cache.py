@@ -0,0 +1,74 @@
+"""
+Caches en mémoire du processus.
+
+TTLCache : cache LRU borné dont chaque entrée expire à une date donnée.
+RevocationList : ensemble de clés révoquées, chacune oubliée à son expiration.
+"""
+import heapq
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # clé -> (date d'expiration, valeur), de la moins à la plus récemment utilisée
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        """Ajoute une entrée ; elle expire au plus tard après le TTL du cache"""
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        self.entries[key] = (deadline, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RevocationList:
+    def __init__(self):
+        self.expirations: dict = {}
+        # Tas (expiration, clé) pour purger les entrées expirées sans tout parcourir
+        self.heap: List[Tuple[float, Hashable]] = []
+
+    def add(self, key: Hashable, expires_at: float):
+        self.expirations[key] = expires_at
+        heapq.heappush(self.heap, (expires_at, key))
+
+    def __contains__(self, key: Hashable) -> bool:
+        self.purge()
+        return key in self.expirations
+
+    def purge(self):
+        """Oublie les clés dont l'expiration est passée (elles ne peuvent plus valider)"""
+        now = time.time()
+        while self.heap and self.heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self.heap)
+            if self.expirations.get(key) == expires_at:
+                del self.expirations[key]
+
+    def __len__(self):
+        return len(self.expirations)
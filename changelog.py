@@ -0,0 +1,147 @@
+"""
+Journal des changements pour la resynchronisation des clients.
+
+Chaque événement de messagerie (nouveau message, modification, suppression,
+accusé de lecture) est ajouté à la table ChangeLog dans la transaction qui
+l'a produit. Son id est le numéro de séquence diffusé avec l'événement
+("seq") : un client qui se reconnecte ne récupère que les événements
+postérieurs au dernier seq reçu, via /message/sync ou resume_from.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import HTTPException, status
+from sqlmodel import select, delete, func, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_session
+from memberships import member_conversations
+from models import ChangeLog, Message, SyncPage
+from serialization import dumps, loads
+
+SYNC_PAGE_SIZE = 500
+# Durée (secondes) de conservation des événements, et intervalle de purge
+CHANGELOG_RETENTION = float(os.getenv("CHANGELOG_RETENTION", str(7 * 24 * 3600)))
+CHANGELOG_COMPACTION_INTERVAL = float(os.getenv("CHANGELOG_COMPACTION_INTERVAL", "3600"))
+
+
+def new_message_event(message: Message) -> dict:
+    return {
+        "type": "new_message",
+        "id": message.id,
+        "content": message.content,
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "conversation_id": message.conversation_id,
+        "created_at": message.created_at.isoformat() if message.created_at else None
+    }
+
+
+def _add_change(
+    session: AsyncSession,
+    event: dict,
+    sender_id: int,
+    receiver_id: Optional[int],
+    message_id: Optional[int],
+    conversation_id: Optional[int] = None
+) -> ChangeLog:
+    change = ChangeLog(
+        event_type=event["type"],
+        message_id=message_id,
+        sender_id=sender_id,
+        receiver_id=receiver_id,
+        conversation_id=conversation_id,
+        payload=dumps(event).decode()
+    )
+    session.add(change)
+    return change
+
+
+async def log_event(
+    session: AsyncSession,
+    event: dict,
+    sender_id: int,
+    receiver_id: Optional[int],
+    message_id: Optional[int] = None,
+    conversation_id: Optional[int] = None
+) -> dict:
+    """
+    Journalise un événement (commit à la charge de l'appelant) et lui ajoute son seq.
+    Un événement de groupe est journalisé une fois, avec son conversation_id
+    """
+    change = _add_change(session, event, sender_id, receiver_id, message_id, conversation_id)
+    await session.flush()
+    event["seq"] = change.id
+    return event
+
+
+async def log_new_messages(session: AsyncSession, messages: List[Message]) -> List[dict]:
+    """Journalise un lot de messages déjà flushés ; renvoie leurs événements new_message"""
+    events = [new_message_event(message) for message in messages]
+    changes = [
+        _add_change(session, event, message.sender_id, message.receiver_id, message.id, message.conversation_id)
+        for event, message in zip(events, messages)
+    ]
+    await session.flush()
+    for event, change in zip(events, changes):
+        event["seq"] = change.id
+    return events
+
+
+async def fetch_changes(session: AsyncSession, user_id: int, since: Optional[int], limit: int = SYNC_PAGE_SIZE) -> SyncPage:
+    """Événements de l'utilisateur postérieurs à since (410 si le journal a été purgé depuis)"""
+    if since is None:
+        # Pas de point de reprise : seulement la séquence courante, avant un chargement complet
+        head = (await session.exec(select(func.max(ChangeLog.id)))).first()
+        return SyncPage(events=[], seq=head or 0)
+
+    oldest = (await session.exec(select(func.min(ChangeLog.id)))).first()
+    # Journal entièrement purgé : impossible de savoir si since était à jour, le client
+    # recharge tout (un seul rechargement, et seulement après toute une rétention d'inactivité)
+    if (oldest is None and since > 0) or (oldest is not None and since < oldest - 1):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Événements purgés depuis cette séquence, resynchronisation complète requise"
+        )
+
+    changes = (await session.exec(
+        select(ChangeLog)
+        .where(or_(
+            ChangeLog.sender_id == user_id,
+            ChangeLog.receiver_id == user_id,
+            ChangeLog.conversation_id.in_(member_conversations(user_id))
+        ))
+        .where(ChangeLog.id > since)
+        .order_by(ChangeLog.id)
+        .limit(limit + 1)
+    )).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    return SyncPage(
+        events=[{**loads(change.payload), "seq": change.id} for change in changes],
+        seq=changes[-1].id if changes else since,
+        has_more=has_more
+    )
+
+
+async def purge_old_changes() -> int:
+    """Supprime les événements plus anciens que la rétention"""
+    async with async_session() as session:
+        result = await session.exec(
+            delete(ChangeLog)
+            .where(ChangeLog.created_at < datetime.utcnow() - timedelta(seconds=CHANGELOG_RETENTION))
+        )
+        await session.commit()
+    return result.rowcount
+
+
+async def changelog_compaction_loop():
+    """Tâche de fond : purge périodiquement les événements expirés du journal"""
+    while True:
+        await asyncio.sleep(CHANGELOG_COMPACTION_INTERVAL)
+        try:
+            purged = await purge_old_changes()
+            if purged:
+                print(f"Journal compacté : {purged} événement(s) supprimé(s)")
+        except Exception as e:
+            print(f"Erreur compaction journal: {e}")
@@ -0,0 +1,141 @@
+"""
+Connexion WebSocket avec file d'envoi dédiée.
+
+Chaque connexion possède une file bornée et une tâche d'écriture : la diffusion
+se contente de mettre en file (sans attendre le réseau), si bien qu'un client
+lent ne retarde plus les autres destinataires.
+"""
+import asyncio
+import os
+from typing import Dict, Hashable, Iterable, Optional
+from fastapi import WebSocket, WebSocketDisconnect
+from metrics import Counter
+from serialization import Frame, loads
+
+# Taille maximale de la file d'envoi par connexion
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# Messages reçus par connexion en attente d'écriture ; au-delà, le socket n'est plus lu
+MAX_PENDING_WRITES = int(os.getenv("WS_MAX_PENDING_WRITES", "32"))
+# Politique quand la file est pleine. Seul un événement remplaçable (statut de présence,
+# avec une clé) peut être perdu : un message de chat qui ne tient plus déconnecte le
+# client quelle que soit la politique, pour qu'il reprenne par resume_from
+#   drop       -> l'événement remplaçable est abandonné
+#   coalesce   -> l'événement remplaçable écrase la version encore en file pour la même clé
+#   disconnect -> le client trop lent est déconnecté
+SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop")
+SLOW_CONSUMER_POLICIES = ("drop", "coalesce", "disconnect")
+
+# Code de fermeture WebSocket pour un client trop lent (policy violation)
+SLOW_CONSUMER_CLOSE_CODE = 1008
+
+frames_received = Counter("ws_frames_received_total", "Trames WebSocket reçues des clients")
+frames_sent = Counter("ws_frames_sent_total", "Trames WebSocket envoyées aux clients")
+frames_dropped = Counter("ws_frames_dropped_total", "Trames abandonnées ou remplacées faute de place dans la file d'envoi")
+
+
+class ClientConnection:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        queue_size: int = SEND_QUEUE_SIZE,
+        policy: str = SLOW_CONSUMER_POLICY,
+        binary: bool = False,
+        channels: Iterable[str] = ()
+    ):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Politique inconnue : {policy}")
+        self.websocket = websocket
+        self.user_id = user_id
+        self.policy = policy
+        # Trames binaires : les bytes pré-encodés partent tels quels
+        self.binary = binary
+        # Canaux multiplexés sur ce socket (chat, presence, broadcast)
+        self.channels = frozenset(channels)
+        # Entrées [trame, clé] : la trame d'une entrée remplaçable peut être écrasée sur place
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # clé -> entrée encore en file, pour les événements remplaçables
+        self.replaceable: Dict[Hashable, list] = {}
+        self.closed = False
+        self.dropped = 0
+        self.writer_task = None
+        self.close_task = None
+        # Écritures en cours (send_message) ; la lecture attend qu'une place se libère
+        self.write_slots = asyncio.Semaphore(MAX_PENDING_WRITES)
+
+    def start(self):
+        """Démarre la tâche d'écriture de la connexion"""
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def send(self, message: Frame, key: Optional[Hashable] = None) -> bool:
+        """
+        Met un message en file sans attendre le réseau. Retourne False s'il est abandonné.
+        key : clé d'un événement remplaçable (seule sa dernière version compte)
+        """
+        if self.closed:
+            return False
+        entry = [message, key]
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            return self._on_queue_full(message, key)
+        if key is not None:
+            self.replaceable[key] = entry
+        return True
+
+    def _on_queue_full(self, message: Frame, key: Optional[Hashable]) -> bool:
+        self.dropped += 1
+        frames_dropped.inc(policy=self.policy)
+        if self.policy == "coalesce" and key in self.replaceable:
+            # La version en attente n'a plus d'intérêt : remplacée sur place
+            self.replaceable[key][0] = message
+            return True
+        if key is not None and self.policy != "disconnect":
+            return False
+        # Jamais de message de chat perdu en silence : le client se reconnecte et rattrape
+        if self.close_task is None:
+            print(f"Client lent déconnecté (utilisateur {self.user_id})")
+            self.close_task = asyncio.create_task(self.close(SLOW_CONSUMER_CLOSE_CODE))
+        return False
+
+    async def receive(self) -> dict:
+        """Lit le prochain événement client, en trame texte ou binaire"""
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        frames_received.inc()
+        data = message.get("text")
+        return loads(data if data is not None else message["bytes"])
+
+    async def _writer(self):
+        try:
+            while True:
+                entry = await self.queue.get()
+                message, key = entry
+                if key is not None and self.replaceable.get(key) is entry:
+                    del self.replaceable[key]
+                if self.binary:
+                    await self.websocket.send_bytes(message.data)
+                else:
+                    await self.websocket.send_text(message.text)
+                frames_sent.inc()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Connexion fermée côté client : la réception la nettoiera
+            pass
+        finally:
+            self.closed = True
+
+    def stop(self):
+        """Arrête la tâche d'écriture (la connexion est retirée du gestionnaire)"""
+        self.closed = True
+        if self.writer_task:
+            self.writer_task.cancel()
+
+    async def close(self, code: int = 1000):
+        self.stop()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
@@ -1,14 +1,88 @@
-from sqlmodel import SQLModel, create_engine, Session
-from fastapi import Depends
+import os
+import time
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import configure_mappers
-DATABASE_URL = "sqlite:///database.db"
-engine = create_engine(DATABASE_URL, echo=True)
+from metrics import Counter, Gauge, Histogram, current_request
 
-def create_db_and_tables():
+# URL async : sqlite+aiosqlite par défaut, postgresql+asyncpg://... etc. via l'environnement
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///database.db")
+# Journalisation SQL (désactivée par défaut : elle coûte cher sur le chemin critique)
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() in ("1", "true", "yes")
+# Pool de connexions, par worker uvicorn
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# Profil SQLite appliqué à chaque nouvelle connexion
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # millisecondes
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # négatif = KiB (64 Mo)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+is_sqlite = DATABASE_URL.startswith("sqlite")
+is_memory = is_sqlite and (":memory:" in DATABASE_URL or DATABASE_URL.endswith("://"))
+
+engine_options = {"echo": DATABASE_ECHO}
+if not is_memory:
+    engine_options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=not is_sqlite)
+engine = create_async_engine(DATABASE_URL, **engine_options)
+
+if is_sqlite:
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+# Requêtes SQL : total, durée, et cumul sur la requête HTTP en cours
+db_queries = Counter("db_queries_total", "Requêtes SQL exécutées")
+db_query_duration = Histogram(
+    "db_query_duration_seconds",
+    "Durée des requêtes SQL",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._query_start
+    db_queries.inc()
+    db_query_duration.observe(duration)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += duration
+
+# Connexions du pool (une WebSocket inactive n'en tient aucune)
+db_connections_in_use = Gauge(
+    "db_connections_in_use",
+    "Connexions à la base actuellement empruntées au pool",
+    function=lambda: getattr(engine.pool, "checkedout", lambda: 0)(),
+)
+db_connections_idle = Gauge(
+    "db_connections_idle",
+    "Connexions à la base ouvertes et disponibles dans le pool",
+    function=lambda: getattr(engine.pool, "checkedin", lambda: 0)(),
+)
+
+# expire_on_commit=False : les objets restent lisibles après commit sans requête implicite
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+async def create_db_and_tables():
     configure_mappers()
-    SQLModel.metadata.create_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
 
-def get_session():
-    with Session(engine) as session:
+async def get_session():
+    async with async_session() as session:
         yield session
-        print("Session closed")
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Export en flux de l'historique d'un utilisateur.
+
+Les lignes sont lues par paquets de EXPORT_CHUNK_SIZE via un curseur côté
+serveur (yield_per), en colonnes brutes plutôt qu'en objets Message : ni
+construction ORM, ni validation pydantic, et une mémoire constante quelle que
+soit la taille de l'historique. Chaque paquet est encodé (NDJSON ou CSV) et
+envoyé avant de lire le suivant.
+"""
+import csv
+import io
+import os
+from datetime import datetime
+from typing import AsyncIterator, Sequence
+from sqlmodel import select
+from database import async_session
+from models import Message
+from memberships import visible_messages
+from serialization import dumps
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+EXPORT_COLUMNS = (
+    "id", "created_at", "sender_id", "receiver_id",
+    "conversation_id", "conversation_key", "content"
+)
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode_ndjson(rows: Sequence) -> bytes:
+    return b"".join(
+        dumps({name: _value(value) for name, value in zip(EXPORT_COLUMNS, row)}) + b"\n"
+        for row in rows
+    )
+
+
+def _encode_csv(rows: Sequence, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows([_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def export_messages(user_id: int, format: str = "ndjson") -> AsyncIterator[bytes]:
+    """
+    Messages visibles par l'utilisateur, par ordre d'id. Ouvre sa propre session :
+    la réponse est envoyée après la fin de la route, et la connexion reste prise
+    pendant tout l'export
+    """
+    columns = [Message.__table__.c[name] for name in EXPORT_COLUMNS]
+    query = (
+        select(*columns)
+        .where(visible_messages(user_id))
+        .order_by(Message.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    if format == "csv":
+        yield _encode_csv([], header=True)
+    async with async_session() as session:
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            yield _encode_csv(rows) if format == "csv" else _encode_ndjson(rows)
@@ -0,0 +1,82 @@
+"""
+Hachage des mots de passe hors de la boucle d'événements.
+
+bcrypt bloque plusieurs dizaines de millisecondes par appel : les calculs
+sont confiés à un pool (threads ou processus) borné. Au-delà de
+PASSWORD_HASH_MAX_PENDING calculs en attente, les requêtes reçoivent un 503
+plutôt que de s'accumuler.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from metrics import Gauge, Histogram
+
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # thread | process
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+hash_latency = Histogram(
+    "password_hash_seconds",
+    "Durée des opérations bcrypt, attente dans le pool comprise",
+)
+hash_pending = Gauge("password_hash_pending", "Opérations bcrypt en cours ou en attente")
+
+_executor: Executor = None
+_pending = 0
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(operation: str, function, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Trop de requêtes d'authentification, réessayez plus tard",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    hash_pending.set(_pending)
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), function, *args)
+    finally:
+        _pending -= 1
+        hash_pending.set(_pending)
+        hash_latency.observe(time.perf_counter() - start, operation=operation)
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run("verify", _verify, plain_password, hashed_password)
@@ -0,0 +1,96 @@
+"""
+Heartbeat serveur des WebSockets.
+
+Une seule tâche surveille toutes les connexions. Chaque connexion est rangée
+dans l'une de deux files ordonnées par échéance : `waiting` (aucune trame reçue
+depuis moins de WS_HEARTBEAT_INTERVAL secondes) puis `pinged` (ping envoyé,
+réponse attendue sous WS_HEARTBEAT_TIMEOUT secondes). Une trame reçue remet la
+connexion en fin de `waiting` en O(1) ; chaque tick ne parcourt que le début
+des files, c'est-à-dire les connexions arrivées à échéance.
+
+Le heartbeat applicatif est à la demande du client (`heartbeat=true` à la
+connexion) : un client qui ne sait pas répondre au ping et ne fait qu'écouter
+serait sinon fermé. Les autres connexions reposent sur les pings du protocole
+WebSocket envoyés par le serveur ASGI (`--ws-ping-interval` d'uvicorn).
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+from connection import ClientConnection
+from metrics import Counter
+
+# Délai sans trame reçue avant l'envoi d'un ping (secondes)
+HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+# Délai de réponse au ping avant fermeture de la connexion (secondes)
+HEARTBEAT_TIMEOUT = float(os.getenv("WS_HEARTBEAT_TIMEOUT", "10"))
+# Période de la tâche de surveillance (secondes)
+HEARTBEAT_TICK = float(os.getenv("WS_HEARTBEAT_TICK", "1"))
+
+# Code de fermeture WebSocket d'une connexion sans réponse au heartbeat
+HEARTBEAT_CLOSE_CODE = 4003
+
+heartbeat_pings = Counter("ws_heartbeat_pings_total", "Pings de heartbeat envoyés par le serveur")
+connections_reaped = Counter("ws_connections_reaped_total", "Connexions WebSocket fermées faute de réponse au heartbeat")
+
+
+class HeartbeatScheduler:
+    def __init__(
+        self,
+        interval: float = HEARTBEAT_INTERVAL,
+        timeout: float = HEARTBEAT_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.clock = clock
+        # connexion -> échéance ; l'ordre d'insertion est l'ordre des échéances
+        self.waiting: "OrderedDict[ClientConnection, float]" = OrderedDict()
+        self.pinged: "OrderedDict[ClientConnection, float]" = OrderedDict()
+        self.reaped = 0
+
+    def __len__(self) -> int:
+        return len(self.waiting) + len(self.pinged)
+
+    def track(self, connection: ClientConnection):
+        """Nouvelle connexion (ou trame reçue) : prochain ping dans `interval` secondes"""
+        self.pinged.pop(connection, None)
+        self.waiting.pop(connection, None)
+        self.waiting[connection] = self.clock() + self.interval
+
+    def touch(self, connection: ClientConnection):
+        """Toute trame reçue prouve que la connexion est vivante (si elle est suivie)"""
+        if connection in self.waiting or connection in self.pinged:
+            self.track(connection)
+
+    def forget(self, connection: ClientConnection):
+        self.waiting.pop(connection, None)
+        self.pinged.pop(connection, None)
+
+    def advance(self) -> Tuple[List[ClientConnection], List[ClientConnection]]:
+        """
+        Renvoie (connexions à pinger, connexions expirées). Les expirées ne sont
+        plus suivies ; c'est à l'appelant de les fermer
+        """
+        now = self.clock()
+        expired = []
+        while self.pinged:
+            connection, deadline = next(iter(self.pinged.items()))
+            if deadline > now:
+                break
+            del self.pinged[connection]
+            expired.append(connection)
+
+        to_ping = []
+        while self.waiting:
+            connection, deadline = next(iter(self.waiting.items()))
+            if deadline > now:
+                break
+            del self.waiting[connection]
+            self.pinged[connection] = now + self.timeout
+            to_ping.append(connection)
+
+        self.reaped += len(expired)
+        connections_reaped.inc(len(expired))
+        heartbeat_pings.inc(len(to_ping))
+        return to_ping, expired
@@ -1,12 +1,50 @@
 from fastapi import FastAPI 
+from fastapi.responses import PlainTextResponse
+from contextlib import asynccontextmanager
+import asyncio
+import metrics
 from database import create_db_and_tables , get_session
+from broadcast import broadcast
+from hashing import shutdown_executor
+from write_pipeline import message_writer
+from changelog import changelog_compaction_loop
+from search import create_search_index
 from routers.user import router as users_router
+from registry import heartbeat_loop, presence_loop, presence_sync_loop, registry
 from routers.message import router as messages_router
-from routers.auth import router as auth_router
+from routers.group import router as groups_router
+from routers.auth import router as auth_router, load_revoked_tokens, token_compaction_loop
 from fastapi.middleware.cors import CORSMiddleware
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ## create database
+    await create_db_and_tables()
+    await create_search_index()
+    await load_revoked_tokens()
+    await broadcast.connect()
+    message_writer.start()
+    # Tâches de fond démarrées avec l'application
+    background_tasks = [
+        asyncio.create_task(token_compaction_loop()),
+        asyncio.create_task(changelog_compaction_loop()),
+        asyncio.create_task(presence_loop()),
+        asyncio.create_task(presence_sync_loop()),
+        asyncio.create_task(heartbeat_loop()),
+    ]
+
+    yield
+
+    for task in background_tasks:
+        task.cancel()
+    await message_writer.stop()
+    await registry.leave_cluster()
+    await broadcast.disconnect()
+    shutdown_executor()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,14 +53,19 @@ app.add_middleware(
     allow_methods=["*"],  # Permet toutes les méthodes HTTP
     allow_headers=["*"],  # Permet tous les headers
     )
+# Latence, statut et requêtes SQL de chaque requête HTTP, par route
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(auth_router, prefix="/auth")
 app.include_router(users_router, prefix="/user")
 app.include_router(messages_router, prefix="/message")
-## create database
-@app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+app.include_router(groups_router, prefix="/group")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Exposition texte Prometheus de toutes les métriques du worker"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
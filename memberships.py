@@ -0,0 +1,72 @@
+"""
+Membres des conversations de groupe, en cache.
+
+La diffusion d'un message de groupe résout ses destinataires ici plutôt que
+par une requête par message : conversation_id -> membres, chargé une fois puis
+gardé en mémoire. Tout ajout ou retrait de membre invalide l'entrée sur tous
+les workers via le backplane.
+"""
+import os
+from typing import FrozenSet, List, Optional
+from sqlmodel import select
+from broadcast import broadcast
+from cache import TTLCache
+from database import async_session
+from models import Membership, Message
+from serialization import dumps, loads
+
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "300"))
+MEMBERSHIP_CHANNEL = "memberships"
+
+# conversation_id -> frozenset des user_id membres
+member_cache = TTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL)
+
+
+async def get_members(conversation_id: int) -> FrozenSet[int]:
+    members = member_cache.get(conversation_id)
+    if members is None:
+        async with async_session() as session:
+            user_ids = (await session.exec(
+                select(Membership.user_id).where(Membership.conversation_id == conversation_id)
+            )).all()
+        members = frozenset(user_ids)
+        member_cache.set(conversation_id, members)
+    return members
+
+
+async def is_member(conversation_id: int, user_id: int) -> bool:
+    return user_id in await get_members(conversation_id)
+
+
+async def recipients(sender_id: int, receiver_id: Optional[int], conversation_id: Optional[int]) -> List[int]:
+    """Destinataires d'un événement : les membres du groupe, ou les deux participants"""
+    if conversation_id is not None:
+        return list(await get_members(conversation_id))
+    return [sender_id, receiver_id]
+
+
+def member_conversations(user_id: int):
+    """Sous-requête : ids des groupes dont l'utilisateur est membre"""
+    return select(Membership.conversation_id).where(Membership.user_id == user_id)
+
+
+def visible_messages(user_id: int):
+    """Condition SQL : messages envoyés, reçus, ou postés dans un groupe de l'utilisateur"""
+    return (
+        (Message.sender_id == user_id)
+        | (Message.receiver_id == user_id)
+        | Message.conversation_id.in_(member_conversations(user_id))
+    )
+
+
+async def handle_membership_event(raw: bytes):
+    member_cache.delete(loads(raw)["conversation_id"])
+
+broadcast.subscribe(MEMBERSHIP_CHANNEL, handle_membership_event)
+
+
+async def invalidate_members(conversation_id: int):
+    """À appeler après tout changement de membres (une fois la transaction commitée)"""
+    member_cache.delete(conversation_id)
+    await broadcast.publish(MEMBERSHIP_CHANNEL, dumps({"conversation_id": conversation_id}))
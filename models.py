@@ -1,17 +1,44 @@
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import String
+from sqlalchemy import String, Index, UniqueConstraint, func
 from sqlalchemy.orm import Mapped
-from typing import Optional, List
+from typing import Any, Optional, List
 from datetime import datetime
 
 
+def make_conversation_key(user_a: int, user_b: int) -> str:
+    """Clé normalisée d'une conversation : identique quel que soit le sens du message"""
+    low, high = sorted((user_a, user_b))
+    return f"{low}:{high}"
+
+
+def group_conversation_key(conversation_id: int) -> str:
+    """Clé d'une conversation de groupe (distincte des clés "min:max" des conversations à deux)"""
+    return f"g:{conversation_id}"
+
+
 class Message(SQLModel, table=True):
+    # Index composites : une seule plage d'index par conversation / par utilisateur,
+    # triée par (created_at, id) pour la pagination par curseur
+    __table_args__ = (
+        Index("ix_message_conversation_created", "conversation_key", "created_at", "id"),
+        Index("ix_message_sender_created", "sender_id", "created_at", "id"),
+        Index("ix_message_receiver_created", "receiver_id", "created_at", "id"),
+        # Messages de groupe (conversation_id), la troisième branche de visible_messages
+        Index("ix_message_group_created", "conversation_id", "created_at", "id"),
+        # Ids jamais réutilisés après suppression : last_read_message_id et le journal
+        # supposent des ids strictement croissants
+        {"sqlite_autoincrement": True},
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     content: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     sender_id: int = Field(foreign_key="user.id")
-    receiver_id: int = Field(foreign_key="user.id")
+    # Message privé : receiver_id ; message de groupe : conversation_id (écrit une seule fois)
+    receiver_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    conversation_id: Optional[int] = Field(default=None, foreign_key="conversation.id")
+    conversation_key: Optional[str] = Field(default=None, sa_type=String(50))
 
     sender: Mapped[Optional["User"]] = Relationship(
         back_populates="messages_sent",
@@ -38,6 +65,142 @@ class User(SQLModel, table=True):
         sa_relationship_kwargs={"foreign_keys": "[Message.receiver_id]"}
     )
 
+# Recherche par préfixe (sans casse) de l'annuaire : plages sur lower(name) / lower(email)
+Index("ix_user_name_lower", func.lower(User.name))
+Index("ix_user_email_lower", func.lower(User.email))
+
+class Conversation(SQLModel, table=True):
+    """Conversation de groupe ; ses membres sont dans Membership"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(sa_type=String(100))
+    created_by: int = Field(foreign_key="user.id")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class Membership(SQLModel, table=True):
+    __table_args__ = (
+        UniqueConstraint("conversation_id", "user_id", name="uq_membership_conversation_user"),
+        # Groupes d'un utilisateur
+        Index("ix_membership_user", "user_id", "conversation_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: int = Field(foreign_key="conversation.id")
+    user_id: int = Field(foreign_key="user.id")
+    joined_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ConversationSummary(SQLModel, table=True):
+    """
+    Résumé d'une conversation vu par un utilisateur (une ligne par participant),
+    maintenu à l'envoi, la modification et la suppression des messages
+    """
+    __table_args__ = (
+        UniqueConstraint("user_id", "other_user_id", name="uq_conversationsummary_pair"),
+        # Boîte de réception : conversations d'un utilisateur, la plus récente d'abord
+        Index("ix_conversationsummary_user_last", "user_id", "last_message_at", "id"),
+        # Mise à jour de toutes les lignes d'une conversation (un seul UPDATE par groupe)
+        Index("ix_conversationsummary_key", "conversation_key", "user_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    # Conversation à deux : other_user_id ; groupe : conversation_id
+    other_user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    conversation_id: Optional[int] = Field(default=None, foreign_key="conversation.id")
+    conversation_key: str = Field(sa_type=String(50))
+    last_message_id: Optional[int] = None
+    last_sender_id: Optional[int] = None
+    last_message_preview: Optional[str] = Field(default=None, sa_type=String(100))
+    last_message_at: Optional[datetime] = None
+    # Messages reçus après last_read_message_id
+    unread_count: int = 0
+    last_read_message_id: Optional[int] = None
+
+
+class ChangeLog(SQLModel, table=True):
+    """
+    Journal append-only des événements de messagerie. L'id sert de numéro de
+    séquence : un client reprend là où il s'est arrêté avec since=<seq>
+    """
+    __table_args__ = (
+        # Journal d'un utilisateur = ses événements envoyés ou reçus, par séquence
+        Index("ix_changelog_sender_seq", "sender_id", "id"),
+        Index("ix_changelog_receiver_seq", "receiver_id", "id"),
+        # Événements des groupes : un seul enregistrement par événement, lu par tous les membres
+        Index("ix_changelog_conversation_seq", "conversation_id", "id"),
+        # La séquence ne repart jamais en arrière, même une fois le journal purgé
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    event_type: str = Field(sa_type=String(30))
+    message_id: Optional[int] = None
+    sender_id: int
+    receiver_id: Optional[int] = None
+    conversation_id: Optional[int] = None
+    payload: str  # événement WebSocket encodé en JSON, sans son numéro de séquence
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class MessagePage(SQLModel):
+    """Page de messages (ordre chronologique) avec curseurs opaques"""
+    items: List[Message]
+    before: Optional[str] = None  # curseur pour charger les messages plus anciens
+    after: Optional[str] = None   # curseur pour charger les messages plus récents
+
+class SyncPage(SQLModel):
+    """Événements manqués depuis une séquence, dans l'ordre"""
+    events: List[dict]
+    seq: int                # dernière séquence transmise, à renvoyer dans since
+    has_more: bool = False  # rappeler /message/sync avec seq pour la suite
+
+class SearchHit(SQLModel):
+    message: Message
+    snippet: str   # extrait avec les termes trouvés entre <mark> et </mark>
+    score: float   # pertinence (plus grand = plus pertinent)
+
+class SearchPage(SQLModel):
+    items: List[SearchHit]
+    next_offset: Optional[int] = None  # None : plus de résultats
+
+class MessageBatchItem(SQLModel):
+    """Un message du lot : receiver_id (privé) ou conversation_id (groupe)"""
+    receiver_id: Optional[int] = None
+    conversation_id: Optional[int] = None
+    content: str
+
+class MessageBatch(SQLModel):
+    # Éléments bruts, validés un par un en MessageBatchItem : un élément mal formé
+    # est rejeté à sa position sans faire échouer tout le lot
+    messages: List[Any]
+
+class MessageBatchResult(SQLModel):
+    """Résultat d'un élément du lot, à la même position que dans la requête"""
+    index: int
+    status: int                        # 200, ou le code d'erreur de l'élément
+    message: Optional[Message] = None
+    error: Optional[str] = None
+
+class MessageBatchPage(SQLModel):
+    items: List[MessageBatchResult]
+    sent: int    # messages écrits
+    failed: int  # éléments rejetés (voir leur error)
+
+class GroupCreate(SQLModel):
+    name: str = Field(min_length=1, max_length=100)
+    member_ids: List[int] = []  # le créateur est ajouté d'office
+
+class GroupMembers(SQLModel):
+    user_ids: List[int]
+
+class GroupRead(SQLModel):
+    id: int
+    name: str
+    created_by: int
+    created_at: datetime
+    member_ids: List[int]
+
 class UserCreate(SQLModel):
     name: str
     email: str
@@ -49,9 +212,21 @@ class UserRead(SQLModel):
     name: str
     email: str
 
+class UserPage(SQLModel):
+    """Page de l'annuaire, par id croissant"""
+    items: List[UserRead]
+    after: Optional[int] = None  # id à passer dans after pour la page suivante (None : fin)
+
+class UserBatch(SQLModel):
+    items: List[UserRead]  # dans l'ordre des ids demandés
+    missing: List[int]     # ids sans utilisateur
+
 class TokenBlacklist(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    token: str = Field(index=True, unique=True)
+    # Identifiant compact du token (claim jti) plutôt que le JWT complet
+    jti: str = Field(sa_type=String(64), index=True, unique=True)
+    # Au-delà, le token ne peut plus valider : la ligne peut être purgée
+    expires_at: datetime = Field(index=True)
     blacklisted_at: datetime = Field(default_factory=datetime.utcnow)
     
     class Config:
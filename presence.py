@@ -0,0 +1,193 @@
+"""
+Moteur de présence : online, idle, offline.
+
+L'activité est datée avec une horloge monotone et les expirations sont rangées
+dans une roue temporelle (un créneau par PRESENCE_TICK secondes). Enregistrer
+une activité coûte O(1) ; chaque tick ne traite que le créneau qui expire, quel
+que soit le nombre d'utilisateurs connectés. Les méthodes renvoient le nouveau
+statut uniquement quand il change : seules les transitions sont diffusées.
+
+Ce moteur ne voit que les connexions du worker. Chaque worker annonce sur le
+backplane le statut local de ses utilisateurs, et ClusterPresence rassemble les
+annonces des autres : un utilisateur est online s'il l'est sur au moins un
+worker, offline seulement quand plus aucun worker ne le compte. Un worker qui
+ne donne plus signe de vie pendant PRESENCE_WORKER_TTL secondes est oublié.
+"""
+import math
+import os
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+PRESENCE_IDLE_TIMEOUT = float(os.getenv("PRESENCE_IDLE_TIMEOUT", "300"))
+PRESENCE_TICK = float(os.getenv("PRESENCE_TICK", "1"))
+# Fenêtre (secondes) de regroupement des changements de statut avant diffusion
+PRESENCE_COALESCE_WINDOW = float(os.getenv("PRESENCE_COALESCE_WINDOW", "0.5"))
+# Nombre maximal d'utilisateurs observés par connexion
+PRESENCE_MAX_SUBSCRIPTIONS = int(os.getenv("PRESENCE_MAX_SUBSCRIPTIONS", "1000"))
+# Période (secondes) de l'annonce complète des statuts locaux de chaque worker
+PRESENCE_SYNC_INTERVAL = float(os.getenv("PRESENCE_SYNC_INTERVAL", "10"))
+# Délai (secondes) sans annonce d'un worker avant d'oublier ses utilisateurs
+PRESENCE_WORKER_TTL = float(os.getenv("PRESENCE_WORKER_TTL", "30"))
+
+ONLINE = "online"
+IDLE = "idle"
+OFFLINE = "offline"
+
+# Statut d'un utilisateur connecté à plusieurs workers : le plus actif l'emporte
+STATUS_RANK = {OFFLINE: 0, IDLE: 1, ONLINE: 2}
+
+
+class PresenceEngine:
+    def __init__(
+        self,
+        idle_timeout: float = PRESENCE_IDLE_TIMEOUT,
+        tick: float = PRESENCE_TICK,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.tick = tick
+        self.clock = clock
+        # Délai d'inactivité en ticks ; la roue couvre toujours un délai complet
+        self.timeout_ticks = max(1, math.ceil(idle_timeout / tick))
+        self.wheel: List[Set[int]] = [set() for _ in range(self.timeout_ticks + 1)]
+        # user_id -> tick d'expiration (seulement pour les utilisateurs online)
+        self.deadlines: Dict[int, int] = {}
+        # user_id -> online | idle (absent = offline)
+        self.statuses: Dict[int, str] = {}
+        self.current_tick = self._now()
+
+    def _now(self) -> int:
+        return int(self.clock() / self.tick)
+
+    def _arm(self, user_id: int):
+        deadline = self._now() + self.timeout_ticks
+        previous = self.deadlines.get(user_id)
+        if previous == deadline:
+            # Déjà armé pour ce tick : rien à déplacer
+            return
+        if previous is not None:
+            self.wheel[previous % len(self.wheel)].discard(user_id)
+        self.wheel[deadline % len(self.wheel)].add(user_id)
+        self.deadlines[user_id] = deadline
+
+    def _disarm(self, user_id: int):
+        deadline = self.deadlines.pop(user_id, None)
+        if deadline is not None:
+            self.wheel[deadline % len(self.wheel)].discard(user_id)
+
+    def touch(self, user_id: int) -> Optional[str]:
+        """Activité d'un utilisateur connecté : renvoie ONLINE s'il sort de l'état idle"""
+        status = self.statuses.get(user_id)
+        if status is None:
+            return None
+        self._arm(user_id)
+        if status == IDLE:
+            self.statuses[user_id] = ONLINE
+            return ONLINE
+        return None
+
+    def connect(self, user_id: int) -> Optional[str]:
+        """Première connexion (ou retour d'un utilisateur idle) : renvoie ONLINE"""
+        status = self.statuses.get(user_id)
+        self.statuses[user_id] = ONLINE
+        self._arm(user_id)
+        return None if status == ONLINE else ONLINE
+
+    def disconnect(self, user_id: int) -> Optional[str]:
+        """Dernière connexion fermée : renvoie OFFLINE"""
+        self._disarm(user_id)
+        if self.statuses.pop(user_id, None) is None:
+            return None
+        return OFFLINE
+
+    def advance(self) -> List[Tuple[int, str]]:
+        """Fait tourner la roue jusqu'à maintenant ; renvoie les passages à IDLE"""
+        transitions = []
+        now = self._now()
+        # Après une longue pause, un tour de roue suffit à tout parcourir
+        start = max(self.current_tick + 1, now - len(self.wheel) + 1)
+        for tick in range(start, now + 1):
+            slot = self.wheel[tick % len(self.wheel)]
+            expired = [user_id for user_id in slot if self.deadlines[user_id] <= tick]
+            for user_id in expired:
+                slot.discard(user_id)
+                del self.deadlines[user_id]
+                self.statuses[user_id] = IDLE
+                transitions.append((user_id, IDLE))
+        self.current_tick = now
+        return transitions
+
+    def status(self, user_id: int) -> str:
+        return self.statuses.get(user_id, OFFLINE)
+
+    def is_online(self, user_id: int) -> bool:
+        return self.statuses.get(user_id) == ONLINE
+
+    def online_users(self) -> List[int]:
+        # Les utilisateurs online sont exactement ceux qui ont une échéance armée
+        return list(self.deadlines)
+
+
+class ClusterPresence:
+    """Statuts annoncés par les autres workers, et leur dernière annonce"""
+
+    def __init__(self, ttl: float = PRESENCE_WORKER_TTL, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        # user_id -> worker -> statut (online | idle)
+        self.statuses: Dict[int, Dict[str, str]] = {}
+        # worker -> utilisateurs qu'il compte
+        self.workers: Dict[str, Set[int]] = {}
+        # worker -> instant de sa dernière annonce
+        self.seen: Dict[str, float] = {}
+
+    def update(self, worker: str, user_id: int, status: str):
+        """Statut local d'un utilisateur sur un worker (OFFLINE = plus de connexion)"""
+        self.seen[worker] = self.clock()
+        users = self.workers.setdefault(worker, set())
+        if status == OFFLINE:
+            users.discard(user_id)
+            workers = self.statuses.get(user_id)
+            if workers is not None:
+                workers.pop(worker, None)
+                if not workers:
+                    del self.statuses[user_id]
+        else:
+            users.add(user_id)
+            self.statuses.setdefault(user_id, {})[worker] = status
+
+    def replace(self, worker: str, snapshot: Dict[int, str]) -> Set[int]:
+        """Annonce complète d'un worker ; renvoie les utilisateurs concernés"""
+        affected = self.workers.get(worker, set()) | set(snapshot)
+        for user_id in self.workers.get(worker, set()) - set(snapshot):
+            self.update(worker, user_id, OFFLINE)
+        for user_id, status in snapshot.items():
+            self.update(worker, user_id, status)
+        return affected
+
+    def forget(self, worker: str) -> Set[int]:
+        """Worker arrêté ou muet : ses utilisateurs ne comptent plus"""
+        affected = self.replace(worker, {})
+        self.workers.pop(worker, None)
+        self.seen.pop(worker, None)
+        return affected
+
+    def expire(self) -> Set[int]:
+        """Oublie les workers sans annonce depuis `ttl` secondes ; renvoie les utilisateurs concernés"""
+        deadline = self.clock() - self.ttl
+        affected: Set[int] = set()
+        for worker in [worker for worker, seen in self.seen.items() if seen < deadline]:
+            affected |= self.forget(worker)
+        return affected
+
+    def status(self, user_id: int, local: str = OFFLINE) -> str:
+        """Statut sur l'ensemble du cluster, compte tenu du statut local au worker"""
+        for status in self.statuses.get(user_id, {}).values():
+            if STATUS_RANK[status] > STATUS_RANK[local]:
+                local = status
+        return local
+
+    def users(self, status: Optional[str] = None) -> Set[int]:
+        """Utilisateurs comptés par au moins un autre worker (avec ce statut, si donné)"""
+        if status is None:
+            return set(self.statuses)
+        return {user_id for user_id, workers in self.statuses.items() if status in workers.values()}
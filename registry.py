@@ -0,0 +1,443 @@
+"""
+Registre unique des connexions WebSocket.
+
+Toutes les connexions d'un worker (chat, présence, diffusion générale) sont
+rangées ici par utilisateur, avec ajout et retrait en O(1). Une connexion
+écoute un ou plusieurs canaux multiplexés sur le même socket ; chaque
+événement est publié sur le backplane avec son canal et livré aux seules
+connexions qui l'écoutent. La présence (online / idle / offline) est dérivée
+de ce même registre pour les connexions du worker ; chaque worker annonce ces
+statuts locaux sur le backplane et combine ceux des autres, si bien que tous
+les workers donnent le même statut, quel que soit celui qui porte le socket.
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+from fastapi import WebSocket, WebSocketDisconnect
+from broadcast import broadcast
+from connection import ClientConnection
+from metrics import Gauge, Histogram
+from heartbeat import HEARTBEAT_CLOSE_CODE, HEARTBEAT_TICK, HeartbeatScheduler
+from presence import (
+    OFFLINE, ONLINE, PRESENCE_COALESCE_WINDOW, PRESENCE_MAX_SUBSCRIPTIONS, PRESENCE_SYNC_INTERVAL,
+    PRESENCE_TICK, ClusterPresence, PresenceEngine
+)
+from serialization import Frame, dumps, encode_event, loads, pack_envelope, unpack_envelope
+
+CHAT = "chat"
+PRESENCE = "presence"
+BROADCAST = "broadcast"
+CHANNELS = (CHAT, PRESENCE, BROADCAST)
+# Canal du backplane où chaque worker annonce les statuts de ses utilisateurs
+PRESENCE_SYNC_CHANNEL = "presence"
+
+# Traite une trame reçue (connexion, utilisateur, données) ; True si elle a été prise en charge
+FrameHandler = Callable[[ClientConnection, object, dict], Awaitable[bool]]
+
+ws_connections = Gauge("ws_connections", "Connexions WebSocket ouvertes sur ce worker, par canal écouté")
+fanout_latency = Histogram(
+    "ws_fanout_seconds",
+    "Délai entre la publication d'un événement et sa mise en file sur les sockets locaux",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+def parse_channels(value: str) -> Set[str]:
+    """Canaux demandés dans l'URL ("chat,presence") ; ValueError si l'un est inconnu"""
+    channels = {channel.strip() for channel in value.split(",") if channel.strip()}
+    unknown = channels - set(CHANNELS)
+    if unknown or not channels:
+        raise ValueError(f"Canaux inconnus : {', '.join(sorted(unknown)) or value}")
+    return channels
+
+
+class ConnectionRegistry:
+    def __init__(self, channel: str = "connections"):
+        # user_id -> connexions locales à ce worker
+        self.connections: Dict[int, Set[ClientConnection]] = {}
+        # Les événements passent par le backplane pour atteindre les autres workers
+        self.channel = channel
+        broadcast.subscribe(self.channel, self.handle_event)
+
+        # Statuts online / idle / offline des utilisateurs connectés à ce worker
+        self.presence = PresenceEngine()
+        # Statuts annoncés par les autres workers
+        self.worker_id = uuid.uuid4().hex
+        self.cluster = ClusterPresence()
+        # Derniers statuts locaux annoncés par ce worker (absent = offline)
+        self.announced: Dict[int, str] = {}
+        broadcast.subscribe(PRESENCE_SYNC_CHANNEL, self.handle_presence)
+        # Pings serveur et fermeture des connexions muettes (TCP à moitié ouvert)
+        self.heartbeat = HeartbeatScheduler()
+        # Index inversé : utilisateur observé -> connexions locales abonnées à sa présence
+        self.subscribers: Dict[int, Set[ClientConnection]] = {}
+        # connexion -> utilisateurs qu'elle observe (pour le nettoyage à la déconnexion)
+        self.subscriptions: Dict[ClientConnection, Set[int]] = {}
+        # Derniers statuts notifiés aux abonnés locaux, tous workers confondus (absent = offline)
+        self.known_statuses: Dict[int, str] = {}
+        # Changements locaux en attente d'annonce : user_id -> dernier statut
+        self.pending_statuses: Dict[int, str] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+        # canal -> handler des trames entrantes de ce canal
+        self.frame_handlers: Dict[str, FrameHandler] = {}
+
+    # --- Connexions ---
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        channels: Iterable[str],
+        binary: bool = False,
+        heartbeat: bool = False
+    ) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, user_id, binary=binary, channels=channels)
+        connection.start()
+        self.connections.setdefault(user_id, set()).add(connection)
+        if heartbeat:
+            # Le client a demandé le heartbeat applicatif : il répond aux pings
+            self.heartbeat.track(connection)
+        for channel in connection.channels:
+            ws_connections.inc(channel=channel)
+        print(f"Utilisateur {user_id} connecté via WebSocket ({', '.join(sorted(connection.channels))})")
+
+        # Notifier les abonnés s'il n'était pas déjà online (autre appareil, autre socket)
+        status = self.presence.connect(user_id)
+        if status:
+            self.broadcast_user_status(user_id, status)
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        connection.stop()
+        self.heartbeat.forget(connection)
+        self.unsubscribe(connection, self.subscriptions.get(connection, ()))
+        connections = self.connections.get(connection.user_id)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        for channel in connection.channels:
+            ws_connections.dec(channel=channel)
+        print(f"Utilisateur {connection.user_id} déconnecté du WebSocket")
+
+        # Plus aucune connexion : l'utilisateur passe offline
+        if not connections:
+            del self.connections[connection.user_id]
+            status = self.presence.disconnect(connection.user_id)
+            if status:
+                self.broadcast_user_status(connection.user_id, status)
+
+    def add_frame_handler(self, channel: str, handler: FrameHandler):
+        """Enregistre le traitement des trames entrantes d'un canal"""
+        self.frame_handlers[channel] = handler
+
+    async def serve(self, connection: ClientConnection, user):
+        """
+        Boucle de réception d'un socket : chaque trame compte comme activité puis
+        est confiée aux handlers des canaux écoutés, jusqu'à la déconnexion
+        """
+        try:
+            while True:
+                message_data = await connection.receive()
+                self.heartbeat.touch(connection)
+                if message_data.get("type") == "pong":
+                    # Réponse au heartbeat : la connexion vit, sans activité de l'utilisateur
+                    continue
+                self.update_activity(connection.user_id)
+
+                if message_data.get("type") == "ping":
+                    # Simple ping pour maintenir la connexion active
+                    connection.send(encode_event({
+                        "type": "pong",
+                        "timestamp": datetime.now().isoformat()
+                    }))
+                    continue
+
+                for channel in CHANNELS:
+                    handler = self.frame_handlers.get(channel)
+                    if channel in connection.channels and handler and await handler(connection, user, message_data):
+                        break
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.disconnect(connection)
+
+    def check_heartbeats(self):
+        """Pingue les connexions silencieuses et ferme celles qui n'ont pas répondu"""
+        to_ping, expired = self.heartbeat.advance()
+        if to_ping:
+            frame = encode_event({"type": "ping", "timestamp": datetime.now().isoformat()})
+            for connection in to_ping:
+                connection.send(frame)
+        for connection in expired:
+            print(f"Connexion sans réponse au heartbeat fermée (utilisateur {connection.user_id})")
+            self.disconnect(connection)
+            # Débloque aussi la boucle de réception, qui ne verrait jamais la fin d'un TCP à moitié ouvert
+            asyncio.create_task(connection.close(HEARTBEAT_CLOSE_CODE))
+
+    def connected_users(self) -> List[int]:
+        """Utilisateurs ayant au moins une connexion, sur ce worker ou un autre"""
+        return list(self.cluster.users() | self.connections.keys())
+
+    def send_queue_depth(self) -> int:
+        """Trames en attente d'envoi, toutes connexions confondues (calculé à l'exposition)"""
+        return sum(
+            connection.queue.qsize()
+            for connections in self.connections.values()
+            for connection in connections
+        )
+
+    # --- Diffusion ---
+
+    async def publish(
+        self,
+        channel: str,
+        message: dict,
+        user_ids: Optional[List[int]] = None,
+        exclude: Optional[int] = None
+    ):
+        """Publie un événement sur un canal, pour des utilisateurs (None = tous), sur tous les workers"""
+        # Sérialisé une seule fois, la même trame sert à tous les sockets destinataires
+        frame = encode_event(message)
+        await broadcast.publish(self.channel, pack_envelope({
+            "channel": channel,
+            "user_ids": user_ids,
+            "exclude": exclude,
+            "published_at": time.time()
+        }, frame))
+
+    async def handle_event(self, raw: bytes):
+        """Reçoit un événement du backplane et le livre aux connexions locales"""
+        header, frame = unpack_envelope(raw)
+        if header["user_ids"] is None:
+            self.send_local_broadcast(frame, header["channel"], exclude=header["exclude"])
+            channel = header["channel"]
+        else:
+            for user_id in dict.fromkeys(header["user_ids"]):
+                self.send_local_message(frame, header["channel"], user_id)
+            channel = header["channel"]
+        if "published_at" in header:
+            # Horloge murale : entre workers, la mesure inclut le transit par le backplane
+            fanout_latency.observe(max(0.0, time.time() - header["published_at"]), channel=channel)
+
+    def send_local_message(self, frame: Frame, channel: str, user_id: int):
+        """Met la trame en file sur les connexions locales de l'utilisateur qui écoutent le canal"""
+        if user_id in self.connections:
+            self._enqueue(self.connections[user_id], frame, channel)
+
+    def send_local_broadcast(self, frame: Frame, channel: str, exclude: Optional[int] = None):
+        """Met la trame en file sur toutes les connexions locales qui écoutent le canal"""
+        for user_id, connections in list(self.connections.items()):
+            if user_id != exclude:
+                self._enqueue(connections, frame, channel)
+
+    def _enqueue(
+        self,
+        connections: Set[ClientConnection],
+        frame: Frame,
+        channel: Optional[str] = None,
+        key: Optional[Hashable] = None
+    ):
+        """Mise en file non bloquante ; les connexions fermées sont retirées au passage"""
+        closed_connections = []
+        for connection in connections:
+            if connection.closed:
+                closed_connections.append(connection)
+            elif channel is None or channel in connection.channels:
+                connection.send(frame, key)
+
+        for connection in closed_connections:
+            self.disconnect(connection)
+
+    # --- Présence ---
+
+    def update_activity(self, user_id: int):
+        """Activité d'un utilisateur (n'importe quelle trame reçue, sur n'importe quel canal)"""
+        status = self.presence.touch(user_id)
+        if status:
+            self.broadcast_user_status(user_id, status)
+
+    def user_status(self, user_id: int) -> str:
+        """Statut de l'utilisateur sur l'ensemble des workers"""
+        return self.cluster.status(user_id, self.presence.status(user_id))
+
+    def online_users(self) -> List[int]:
+        """Utilisateurs online sur au moins un worker"""
+        return list(self.cluster.users(ONLINE).union(self.presence.online_users()))
+
+    def active_users_event(self) -> dict:
+        return {
+            "type": "active_users",
+            "users": self.online_users(),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def expire_inactive_users(self):
+        """Fait passer à idle les utilisateurs sans activité depuis le délai configuré"""
+        for user_id, status in self.presence.advance():
+            self.broadcast_user_status(user_id, status)
+
+    def subscribe(self, connection: ClientConnection, user_ids: List[int]) -> List[dict]:
+        """Abonne une connexion à la présence d'utilisateurs ; renvoie leurs statuts actuels"""
+        watched = self.subscriptions.setdefault(connection, set())
+        for user_id in user_ids:
+            if len(watched) >= PRESENCE_MAX_SUBSCRIPTIONS:
+                break
+            watched.add(user_id)
+            self.subscribers.setdefault(user_id, set()).add(connection)
+        return [
+            {"user_id": user_id, "status": self.known_statuses.get(user_id, OFFLINE)}
+            for user_id in user_ids if user_id in watched
+        ]
+
+    def unsubscribe(self, connection: ClientConnection, user_ids: Iterable[int]):
+        watched = self.subscriptions.get(connection)
+        if watched is None:
+            return
+        for user_id in list(user_ids):
+            watched.discard(user_id)
+            subscribers = self.subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.subscribers[user_id]
+        if not watched:
+            del self.subscriptions[connection]
+
+    def _remember_status(self, user_id: int, status: str):
+        if status == OFFLINE:
+            self.known_statuses.pop(user_id, None)
+        else:
+            self.known_statuses[user_id] = status
+
+    def broadcast_user_status(self, user_id: int, status: str):
+        """
+        Annonce le statut local d'un utilisateur aux workers. Les changements sont regroupés
+        pendant PRESENCE_COALESCE_WINDOW : seul le dernier statut de chaque utilisateur
+        est annoncé, et rien du tout s'il est revenu à son statut précédent
+        """
+        self.pending_statuses[user_id] = status
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(PRESENCE_COALESCE_WINDOW)
+        self.flush_task = None
+        await self.flush_statuses()
+
+    async def flush_statuses(self):
+        pending, self.pending_statuses = self.pending_statuses, {}
+        for user_id, status in pending.items():
+            if self.announced.get(user_id, OFFLINE) == status:
+                continue
+            if status == OFFLINE:
+                del self.announced[user_id]
+            else:
+                self.announced[user_id] = status
+            await broadcast.publish(PRESENCE_SYNC_CHANNEL, dumps({
+                "worker": self.worker_id,
+                "user_id": user_id,
+                "status": status,
+                "published_at": time.time()
+            }))
+
+    async def sync_presence(self, hello: bool = False):
+        """
+        Annonce complète des statuts locaux, qui sert aussi de signe de vie ; oublie les
+        workers muets. hello : demande aux autres workers leur annonce (démarrage)
+        """
+        for user_id in self.cluster.expire():
+            self._notify_status(user_id)
+        await broadcast.publish(PRESENCE_SYNC_CHANNEL, dumps({
+            "worker": self.worker_id,
+            # Paires [user_id, statut] : les clés d'un objet JSON seraient des chaînes
+            "snapshot": list(self.announced.items()),
+            "hello": hello,
+            "published_at": time.time()
+        }))
+
+    async def leave_cluster(self):
+        """Arrêt du worker : ses utilisateurs ne comptent plus, sans attendre l'expiration"""
+        await broadcast.publish(PRESENCE_SYNC_CHANNEL, dumps({"worker": self.worker_id, "gone": True}))
+
+    async def handle_presence(self, raw: bytes):
+        """Annonce d'un worker (y compris celui-ci) : notifie les abonnés locaux si le statut change"""
+        event = loads(raw)
+        worker = event["worker"]
+        if worker == self.worker_id:
+            # Le moteur local est déjà à jour ; l'annonce marque la fin de la fenêtre de regroupement
+            affected = {event["user_id"]} if "user_id" in event else set()
+        elif event.get("gone"):
+            affected = self.cluster.forget(worker)
+        elif "snapshot" in event:
+            affected = self.cluster.replace(worker, dict(event["snapshot"]))
+            if event["hello"]:
+                # Nouveau worker : il apprend tout de suite qui est connecté ici
+                await self.sync_presence()
+        else:
+            self.cluster.update(worker, event["user_id"], event["status"])
+            affected = {event["user_id"]}
+
+        for user_id in affected:
+            self._notify_status(user_id)
+        if "published_at" in event:
+            fanout_latency.observe(max(0.0, time.time() - event["published_at"]), channel=PRESENCE)
+
+    def _notify_status(self, user_id: int):
+        status = self.user_status(user_id)
+        if self.known_statuses.get(user_id, OFFLINE) == status:
+            return
+        self._remember_status(user_id, status)
+        if user_id in self.subscribers:
+            frame = encode_event({
+                "type": "user_status",
+                "user_id": user_id,
+                "status": status,
+                "timestamp": datetime.now().isoformat()
+            })
+            # Remplaçable : seul le dernier statut de l'utilisateur compte
+            self._enqueue(self.subscribers[user_id], frame, key=("presence", user_id))
+
+
+# Instance globale du registre
+registry = ConnectionRegistry()
+
+send_queue_depth = Gauge(
+    "ws_send_queue_depth",
+    "Trames en file d'envoi sur l'ensemble des WebSockets du worker",
+    function=registry.send_queue_depth,
+)
+
+
+# Tâche en arrière-plan : passage à idle des utilisateurs inactifs
+async def presence_loop():
+    """Fait avancer la roue de présence à chaque tick"""
+    while True:
+        await asyncio.sleep(PRESENCE_TICK)
+        try:
+            registry.expire_inactive_users()
+        except Exception as e:
+            print(f"Erreur présence: {e}")
+
+
+async def presence_sync_loop():
+    """Annonce périodique des statuts locaux aux autres workers"""
+    await registry.sync_presence(hello=True)
+    while True:
+        await asyncio.sleep(PRESENCE_SYNC_INTERVAL)
+        try:
+            await registry.sync_presence()
+        except Exception as e:
+            print(f"Erreur synchronisation présence: {e}")
+
+
+async def heartbeat_loop():
+    """Une seule tâche pour le heartbeat de toutes les connexions"""
+    while True:
+        await asyncio.sleep(HEARTBEAT_TICK)
+        try:
+            registry.check_heartbeats()
+        except Exception as e:
+            print(f"Erreur heartbeat: {e}")
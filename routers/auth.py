@@ -1,12 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
-from sqlmodel import Session, select
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+import asyncio
+import hashlib
+import os
+import uuid
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.sql import exists
-from passlib.context import CryptContext
-from database import get_session
+from database import get_session, async_session
 from models import User, UserCreate, UserRead, TokenBlacklist
+from broadcast import broadcast
+from cache import TTLCache, RevocationList
+from serialization import dumps, loads
+from hashing import hash_password, verify_password
 
 router = APIRouter(tags=["Authentication"])
 
@@ -15,46 +24,132 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def get_user_by_email(email: str, session: AsyncSession):
+    return (await session.exec(select(User).where(User.email == email))).first()
 
-def get_user_by_email(email: str, session: Session):
-    return session.exec(select(User).where(User.email == email)).first()
-
-def authenticate_user(email: str, password: str, session: Session):
-    user = get_user_by_email(email, session)
-    if not user or not verify_password(password, user.password):
+async def authenticate_user(email: str, password: str, session: AsyncSession):
+    user = await get_user_by_email(email, session)
+    if not user or not await verify_password(password, user.password):
         return None
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire, "sub": str(data["user_id"])})
+    to_encode.update({"exp": expire, "sub": str(data["user_id"]), "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def is_token_blacklisted(token: str, session: Session) -> bool:
+# --- Caches d'authentification (en mémoire, synchronisés entre workers via le backplane) ---
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CHANNEL = "auth"
+# Intervalle (secondes) de purge des tokens blacklistés expirés
+TOKEN_COMPACTION_INTERVAL = float(os.getenv("TOKEN_COMPACTION_INTERVAL", "3600"))
+
+# token -> TokenClaims décodés (l'entrée expire au plus tard avec le token)
+token_cache = TTLCache(AUTH_CACHE_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+# user_id -> copie détachée du User (jamais l'objet d'une session, qu'un rollback périmerait)
+user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+# Blacklist en mémoire (clé jti) : chaque entrée est oubliée une fois le token expiré
+revoked_tokens = RevocationList()
+
+class TokenClaims(NamedTuple):
+    user_id: Optional[int]
+    jti: str
+    expires_at: float
+
+def token_jti(payload: dict, token: str) -> str:
+    """Clé de révocation : le claim jti, ou une empreinte du token pour les anciens tokens"""
+    return payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+async def load_revoked_tokens():
+    """Charge au démarrage les tokens blacklistés encore valides"""
+    async with async_session() as session:
+        rows = (await session.exec(
+            select(TokenBlacklist.jti, TokenBlacklist.expires_at).where(
+                TokenBlacklist.expires_at > datetime.utcnow()
+            )
+        )).all()
+    for jti, expires_at in rows:
+        revoked_tokens.add(jti, expires_at.replace(tzinfo=timezone.utc).timestamp())
+
+async def purge_expired_tokens() -> int:
+    """Supprime les lignes de blacklist dont le token ne peut plus valider"""
+    async with async_session() as session:
+        result = await session.exec(
+            delete(TokenBlacklist).where(TokenBlacklist.expires_at <= datetime.utcnow())
+        )
+        await session.commit()
+    return result.rowcount
+
+async def token_compaction_loop():
+    """Tâche de fond : compacte périodiquement la table token_blacklist"""
+    while True:
+        await asyncio.sleep(TOKEN_COMPACTION_INTERVAL)
+        try:
+            purged = await purge_expired_tokens()
+            if purged:
+                print(f"Blacklist compactée : {purged} token(s) expiré(s) supprimé(s)")
+        except Exception as e:
+            print(f"Erreur compaction blacklist: {e}")
+
+async def handle_auth_event(raw: bytes):
+    """Applique une révocation ou une invalidation publiée par un worker"""
+    event = loads(raw)
+    if event["type"] == "revoke":
+        revoked_tokens.add(event["jti"], event["expires_at"])
+    elif event["type"] == "user_updated":
+        user_cache.delete(event["user_id"])
+
+broadcast.subscribe(AUTH_CHANNEL, handle_auth_event)
+
+async def revoke_token(jti: str, expires_at: float):
+    revoked_tokens.add(jti, expires_at)
+    await broadcast.publish(AUTH_CHANNEL, dumps({
+        "type": "revoke", "jti": jti, "expires_at": expires_at
+    }))
+
+async def invalidate_user(user_id: int):
+    """À appeler après toute modification d'un utilisateur"""
+    user_cache.delete(user_id)
+    await broadcast.publish(AUTH_CHANNEL, dumps({"type": "user_updated", "user_id": user_id}))
+
+def is_token_blacklisted(jti: str) -> bool:
     """Vérifier si un token est dans la blacklist"""
-    blacklisted = session.exec(
-        select(TokenBlacklist).where(TokenBlacklist.token == token)
-    ).first()
-    return blacklisted is not None
+    return jti in revoked_tokens
 
-async def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+def decode_token(token: str) -> TokenClaims:
+    """Décode le token (résultat mis en cache). Lève JWTError si le token est invalide."""
+    claims = token_cache.get(token)
+    if claims is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        claims = TokenClaims(
+            user_id=int(payload["sub"]) if payload.get("sub") else None,
+            jti=token_jti(payload, token),
+            expires_at=float(payload["exp"])
+        )
+        token_cache.set(token, claims, expires_at=claims.expires_at)
+    return claims
+
+async def load_user(user_id: int, session: AsyncSession) -> Optional[User]:
+    """
+    Utilisateur en cache, en lecture seule : une copie hors session. Pour le
+    modifier, le recharger depuis la session (session.get) puis invalidate_user
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        row = await session.get(User, user_id)
+        if row:
+            user = User.model_validate(row.model_dump())
+            user_cache.set(user_id, user)
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)):
     """Récupérer l'utilisateur actuel avec vérification de blacklist"""
     try:
-        # Vérifier si le token est blacklisté
-        if is_token_blacklisted(token, session):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED, 
-                detail="Token has been revoked"
-            )
-        
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if not user_id:
+        claims = decode_token(token)
+        if not claims.user_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, 
                 detail="Invalid token"
@@ -65,7 +160,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), session: Session
             detail="Invalid token"
         )
     
-    user = session.get(User, int(user_id))
+    # Vérifier si le token est blacklisté
+    if is_token_blacklisted(claims.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="Token has been revoked"
+        )
+    
+    user = await load_user(claims.user_id, session)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -73,46 +175,41 @@ async def get_current_user(token: str = Depends(oauth2_scheme), session: Session
         )
     return user
 
-async def get_user_from_token(token: str, session: Session) -> User:
+async def get_user_from_token(token: str, session: AsyncSession) -> User:
     """
     Authentifie un utilisateur à partir d'un token JWT pour WebSocket
     Retourne None si le token est invalide ou blacklisté
     """
     try:
-        # Vérifier si le token est blacklisté
-        if is_token_blacklisted(token, session):
-            return None
-        
         # Décoder le token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
+        claims = decode_token(token)
         
-        if user_id is None:
+        # Vérifier si le token est blacklisté
+        if claims.user_id is None or is_token_blacklisted(claims.jti):
             return None
         
         # Récupérer l'utilisateur
-        user = session.get(User, int(user_id))
-        return user
+        return await load_user(claims.user_id, session)
         
     except JWTError:
         return None
 
 @router.post("/register", response_model=UserRead)
-async def register_user(user: UserCreate, session: Session = Depends(get_session)):
-    email_exists = session.exec(select(exists().where(User.email == user.email))).first()
+async def register_user(user: UserCreate, session: AsyncSession = Depends(get_session)):
+    email_exists = (await session.exec(select(exists().where(User.email == user.email)))).first()
     if email_exists:
         raise HTTPException(status_code=400, detail="Email already exists")
     
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await hash_password(user.password)
     db_user = User(name=user.name, email=user.email, password=hashed_password)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     return db_user
 
 @router.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
-    user = authenticate_user(form_data.username, form_data.password, session)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_session)):
+    user = await authenticate_user(form_data.username, form_data.password, session)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -132,19 +229,23 @@ async def read_current_user(current_user: User = Depends(get_current_user)):
     return current_user
 
 @router.post("/logout")
-async def logout(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+async def logout(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)):
     """Déconnexion - ajouter le token à la blacklist"""
     try:
         # Vérifier que le token est valide avant de le blacklister
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        claims = decode_token(token)
+        if is_token_blacklisted(claims.jti):
+            return {"message": "Successfully logged out"}
         
-        # Ajouter le token à la blacklist
+        # Ajouter le token à la blacklist (jti + expiration, purgé ensuite par la compaction)
         blacklisted_token = TokenBlacklist(
-            token=token,
+            jti=claims.jti,
+            expires_at=datetime.fromtimestamp(claims.expires_at, timezone.utc).replace(tzinfo=None),
             blacklisted_at=datetime.utcnow()
         )
         session.add(blacklisted_token)
-        session.commit()
+        await session.commit()
+        await revoke_token(claims.jti, claims.expires_at)
         
         return {"message": "Successfully logged out"}
     
@@ -0,0 +1,217 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Iterable, List, Optional, Set
+import os
+from models import (
+    Conversation, ConversationSummary, GroupCreate, GroupMembers, GroupRead, Membership,
+    Message, MessagePage, User, group_conversation_key
+)
+from database import get_session
+from registry import CHAT, registry
+from routers.auth import get_current_user
+from routers.message import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate_messages, send_message_to_conversation
+from write_pipeline import message_writer
+from summaries import mark_read, member_joined, member_left
+from changelog import log_event
+from memberships import get_members, invalidate_members, is_member
+
+router = APIRouter(tags=["Groupes"])
+
+# Nombre maximal de membres d'un groupe
+GROUP_MAX_MEMBERS = int(os.getenv("GROUP_MAX_MEMBERS", "1000"))
+
+async def load_group(session: AsyncSession, conversation_id: int, user_id: int) -> Conversation:
+    """Le groupe, si l'utilisateur en est membre (404 sinon, sans révéler son existence)"""
+    conversation = None
+    if await is_member(conversation_id, user_id):
+        conversation = await session.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Groupe non trouvé")
+    return conversation
+
+async def check_users_exist(session: AsyncSession, user_ids: Iterable[int]):
+    user_ids = set(user_ids)
+    found = set((await session.exec(select(User.id).where(User.id.in_(user_ids)))).all())
+    missing = sorted(user_ids - found)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Utilisateurs introuvables : {missing}")
+
+async def group_read(conversation: Conversation) -> GroupRead:
+    return GroupRead(
+        id=conversation.id,
+        name=conversation.name,
+        created_by=conversation.created_by,
+        created_at=conversation.created_at,
+        member_ids=sorted(await get_members(conversation.id))
+    )
+
+async def notify_members(
+    session: AsyncSession,
+    conversation: Conversation,
+    actor_id: int,
+    members: Set[int],
+    removed_id: Optional[int] = None
+):
+    """Journalise, commite et diffuse la nouvelle composition du groupe"""
+    event = await log_event(session, {
+        "type": "group_updated",
+        "conversation_id": conversation.id,
+        "name": conversation.name,
+        "member_ids": sorted(members),
+        "removed_id": removed_id
+    }, actor_id, removed_id, conversation_id=conversation.id)
+    await session.commit()
+    await invalidate_members(conversation.id)
+    await send_message_to_conversation(event, actor_id, None, conversation.id)
+    if removed_id is not None:
+        # Le membre retiré est prévenu aussi (receiver_id du journal pour /message/sync)
+        await registry.publish(CHAT, event, [removed_id])
+
+# --- Créer un groupe ---
+@router.post("/", response_model=GroupRead)
+async def create_group(
+    group: GroupCreate,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    member_ids = set(group.member_ids) | {current_user.id}
+    if len(member_ids) > GROUP_MAX_MEMBERS:
+        raise HTTPException(status_code=400, detail=f"Un groupe compte au plus {GROUP_MAX_MEMBERS} membres")
+    await check_users_exist(session, member_ids)
+
+    conversation = Conversation(name=group.name, created_by=current_user.id)
+    session.add(conversation)
+    await session.flush()
+    session.add_all(Membership(conversation_id=conversation.id, user_id=user_id) for user_id in member_ids)
+    await member_joined(session, conversation.id, sorted(member_ids))
+    await notify_members(session, conversation, current_user.id, member_ids)
+    return await group_read(conversation)
+
+# --- Mes groupes ---
+@router.get("/", response_model=List[Conversation])
+async def get_my_groups(
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    query = (
+        select(Conversation)
+        .join(Membership, Membership.conversation_id == Conversation.id)
+        .where(Membership.user_id == current_user.id)
+        .order_by(Conversation.id)
+    )
+    return (await session.exec(query)).all()
+
+# --- Détail d'un groupe ---
+@router.get("/{conversation_id}", response_model=GroupRead)
+async def get_group(
+    conversation_id: int,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await group_read(await load_group(session, conversation_id, current_user.id))
+
+# --- Ajouter des membres ---
+@router.post("/{conversation_id}/members", response_model=GroupRead)
+async def add_members(
+    conversation_id: int,
+    body: GroupMembers,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    conversation = await load_group(session, conversation_id, current_user.id)
+    members = set(await get_members(conversation_id))
+    new_ids = set(body.user_ids) - members
+    if not new_ids:
+        return await group_read(conversation)
+    if len(members) + len(new_ids) > GROUP_MAX_MEMBERS:
+        raise HTTPException(status_code=400, detail=f"Un groupe compte au plus {GROUP_MAX_MEMBERS} membres")
+    await check_users_exist(session, new_ids)
+
+    session.add_all(Membership(conversation_id=conversation_id, user_id=user_id) for user_id in new_ids)
+    await member_joined(session, conversation_id, sorted(new_ids))
+    await notify_members(session, conversation, current_user.id, members | new_ids)
+    return await group_read(conversation)
+
+# --- Retirer un membre (soi-même, ou par le créateur du groupe) ---
+@router.delete("/{conversation_id}/members/{user_id}")
+async def remove_member(
+    conversation_id: int,
+    user_id: int,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    conversation = await load_group(session, conversation_id, current_user.id)
+    if user_id != current_user.id and conversation.created_by != current_user.id:
+        raise HTTPException(status_code=403, detail="Seul le créateur du groupe peut retirer un autre membre")
+    membership = (await session.exec(
+        select(Membership)
+        .where(Membership.conversation_id == conversation_id, Membership.user_id == user_id)
+    )).first()
+    if not membership:
+        raise HTTPException(status_code=404, detail="Membre non trouvé")
+
+    await session.delete(membership)
+    await member_left(session, conversation_id, user_id)
+    members = set(await get_members(conversation_id)) - {user_id}
+    await notify_members(session, conversation, current_user.id, members, removed_id=user_id)
+    return {"message": "Membre retiré du groupe"}
+
+# --- Envoyer un message au groupe (écrit une seule fois) ---
+@router.post("/{conversation_id}/messages", response_model=Message)
+async def send_group_message(
+    conversation_id: int,
+    content: str,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    if not await is_member(conversation_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Groupe non trouvé")
+    # Pas de connexion tenue pendant l'attente du lot (voir POST /message/)
+    await session.close()
+
+    message, event = await message_writer.submit(Message(
+        content=content,
+        sender_id=current_user.id,
+        conversation_id=conversation_id,
+        conversation_key=group_conversation_key(conversation_id)
+    ))
+    await send_message_to_conversation(event, current_user.id, None, conversation_id)
+    return message
+
+# --- Historique du groupe ---
+@router.get("/{conversation_id}/messages", response_model=MessagePage)
+async def get_group_messages(
+    conversation_id: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    if not await is_member(conversation_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Groupe non trouvé")
+    return await paginate_messages(
+        session, Message.conversation_key == group_conversation_key(conversation_id), before, after, limit
+    )
+
+# --- Accusé de lecture du groupe ---
+@router.post("/{conversation_id}/read", response_model=ConversationSummary)
+async def mark_group_read(
+    conversation_id: int,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    summary = await mark_read(session, current_user.id, group_conversation_key(conversation_id))
+    if not summary:
+        raise HTTPException(status_code=404, detail="Groupe non trouvé")
+    read_event = await log_event(session, {
+        "type": "conversation_read",
+        "user_id": current_user.id,
+        "conversation_id": conversation_id,
+        "last_read_message_id": summary.last_read_message_id
+    }, current_user.id, None, conversation_id=conversation_id)
+    await session.commit()
+
+    await send_message_to_conversation(read_event, current_user.id, None, conversation_id)
+    return summary
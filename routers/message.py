@@ -1,134 +1,262 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, Query
-from sqlmodel import Session, select
-from typing import List, Dict
-from models import Message, User
-from database import get_session
-from routers.auth import get_current_user, get_user_from_token
-import json
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import tuple_
+from pydantic import ValidationError
+from typing import List, Optional
+from models import (
+    ConversationSummary, Message, MessageBatch, MessageBatchItem, MessageBatchPage, MessageBatchResult, MessagePage,
+    SearchPage, SyncPage, User, group_conversation_key, make_conversation_key
+)
+from database import get_session, async_session
+from connection import ClientConnection
+from registry import CHAT, PRESENCE, parse_channels, registry
+from serialization import FastJSONResponse, encode_event, rows_to_dicts
+from routers.auth import get_current_user, get_user_from_token, load_user
+from write_pipeline import message_writer
+from summaries import mark_read, message_deleted, message_edited
+from changelog import SYNC_PAGE_SIZE, fetch_changes, log_event
+from search import reindex_message, search_messages, unindex_message
+from export import EXPORT_FORMATS, export_messages
+from memberships import is_member, recipients, visible_messages
+import asyncio
+import base64
+import os
 from datetime import datetime
 
 router = APIRouter(tags=["Messages"])
 
-# Gestionnaire de connexions WebSocket
-class ConnectionManager:
-    def __init__(self):
-        # Dictionnaire pour stocker les connexions WebSocket par user_id
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-        print(f"Utilisateur {user_id} connecté via WebSocket")
-
-    def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-        print(f"Utilisateur {user_id} déconnecté du WebSocket")
-
-    async def send_personal_message(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            disconnected_websockets = []
-            for websocket in self.active_connections[user_id]:
-                try:
-                    await websocket.send_text(json.dumps(message))
-                except:
-                    # Connexion fermée, marquer pour suppression
-                    disconnected_websockets.append(websocket)
-            
-            # Nettoyer les connexions fermées
-            for ws in disconnected_websockets:
-                self.disconnect(ws, user_id)
+# Nombre maximal de messages par requête POST /message/batch
+MESSAGE_BATCH_MAX = int(os.getenv("MESSAGE_BATCH_MAX", "100"))
+
+async def send_message_to_conversation(
+    message: dict,
+    sender_id: int,
+    receiver_id: Optional[int],
+    conversation_id: Optional[int] = None
+):
+    # Envoyer au sender et au receiver, ou à tous les membres du groupe (membres en cache,
+    # une seule publication quel que soit leur nombre)
+    await registry.publish(CHAT, message, await recipients(sender_id, receiver_id, conversation_id))
+
+# --- Pagination par curseur sur (created_at, id) ---
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(message: Message) -> str:
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(message_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+# Colonnes renvoyées par les listes de messages : lues en tuples, sans objets Message
+MESSAGE_COLUMNS = tuple(Message.__table__.c)
+
+async def paginate_messages(
+    session: AsyncSession,
+    condition,
+    before: Optional[str],
+    after: Optional[str],
+    limit: int
+) -> FastJSONResponse:
+    """
+    Page de messages (forme MessagePage) répondant à condition. Pagination keyset :
+    une seule plage d'index, jamais d'OFFSET
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="before et after sont exclusifs")
+
+    query = select(*MESSAGE_COLUMNS).where(condition)
+    position = tuple_(Message.created_at, Message.id)
+    if after:
+        query = query.where(position > decode_cursor(after)).order_by(
+            Message.created_at, Message.id
+        )
+    else:
+        if before:
+            query = query.where(position < decode_cursor(before))
+        # Sans curseur : les messages les plus récents
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+
+    # Un élément de plus pour savoir s'il reste des messages
+    messages = list((await session.exec(query.limit(limit + 1))).all())
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if not after:
+        messages.reverse()
+
+    return FastJSONResponse({
+        "items": rows_to_dicts(messages),
+        "before": encode_cursor(messages[0]) if messages and (has_more or after) else None,
+        "after": encode_cursor(messages[-1]) if messages else after
+    })
+
+# Tâches d'écriture en cours (références gardées jusqu'à leur fin)
+pending_writes = set()
+
+async def persist_and_deliver(connection: ClientConnection, message: Message, client_id=None):
+    """Écrit le message via le pipeline groupé, puis acquitte et diffuse une fois le lot durable"""
+    try:
+        message, event = await message_writer.submit(message)
+    except Exception:
+        connection.send(encode_event({
+            "type": "error",
+            "message": "Échec de l'enregistrement du message",
+            "client_id": client_id
+        }))
+        return
+    finally:
+        connection.write_slots.release()
+
+    if client_id is not None:
+        connection.send(encode_event({"type": "message_ack", "id": message.id, "client_id": client_id}))
+
+    await send_message_to_conversation(event, message.sender_id, message.receiver_id, message.conversation_id)
+
+async def replay_changes(connection: ClientConnection, user_id: int, since: int):
+    """Renvoie au socket les événements manqués depuis since, page par page"""
+    has_more = True
+    while has_more:
+        try:
+            async with async_session() as session:
+                page = await fetch_changes(session, user_id, since)
+        except HTTPException:
+            # Journal purgé depuis : le client doit tout recharger
+            connection.send(encode_event({"type": "resync_required"}))
+            return
+        for event in page.events:
+            connection.send(encode_event(event))
+        since, has_more = page.seq, page.has_more
+    connection.send(encode_event({"type": "resumed", "seq": since}))
+
+async def handle_chat_frame(connection: ClientConnection, current_user: User, message_data: dict) -> bool:
+    """Trames entrantes du canal chat"""
+    if message_data.get("type") != "send_message":
+        return False
 
-    async def send_message_to_conversation(self, message: dict, sender_id: int, receiver_id: int):
-        # Envoyer le message au sender et au receiver
-        await self.send_personal_message(message, sender_id)
-        await self.send_personal_message(message, receiver_id)
+    # Envoyer un message via WebSocket (à un utilisateur, ou à un groupe avec conversation_id)
+    receiver_id = message_data.get("receiver_id")
+    conversation_id = message_data.get("conversation_id")
+    content = message_data.get("content")
+    
+    if not (receiver_id or conversation_id) or not content:
+        connection.send(encode_event({
+            "type": "error",
+            "message": "receiver_id (ou conversation_id) et content requis"
+        }))
+        return True
+
+    # Une trame invalide ne doit jamais atteindre le lot partagé avec les autres utilisateurs
+    if not isinstance(content, str):
+        connection.send(encode_event({
+            "type": "error",
+            "message": "content doit être une chaîne"
+        }))
+        return True
+    
+    if conversation_id:
+        # Membres en cache : pas de requête par message
+        if not isinstance(conversation_id, int) or not await is_member(conversation_id, current_user.id):
+            connection.send(encode_event({
+                "type": "error",
+                "message": "Groupe non trouvé"
+            }))
+            return True
+        message = Message(
+            content=content,
+            sender_id=current_user.id,
+            conversation_id=conversation_id,
+            conversation_key=group_conversation_key(conversation_id)
+        )
+    else:
+        if not isinstance(receiver_id, int):
+            connection.send(encode_event({
+                "type": "error",
+                "message": "receiver_id doit être un entier"
+            }))
+            return True
+        # Vérifier que le destinataire existe
+        async with async_session() as session:
+            receiver = await load_user(receiver_id, session)
+        if not receiver:
+            connection.send(encode_event({
+                "type": "error",
+                "message": "Utilisateur destinataire non trouvé"
+            }))
+            return True
+        message = Message(
+            content=content,
+            sender_id=current_user.id,
+            receiver_id=receiver_id,
+            conversation_key=make_conversation_key(current_user.id, receiver_id)
+        )
+    
+    # Créer le message en base (commit groupé) sans bloquer la réception, dans la limite
+    # des écritures en cours de la connexion : au-delà, la lecture du socket attend
+    await connection.write_slots.acquire()
+    task = asyncio.create_task(
+        persist_and_deliver(connection, message, message_data.get("client_id"))
+    )
+    pending_writes.add(task)
+    task.add_done_callback(pending_writes.discard)
+    return True
 
-# Instance globale du gestionnaire de connexions
-manager = ConnectionManager()
+registry.add_frame_handler(CHAT, handle_chat_frame)
 
 # --- WebSocket endpoint ---
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
     token: str = Query(...),
-    session: Session = Depends(get_session)
+    channels: str = Query(CHAT),
+    binary: bool = Query(False),
+    resume_from: Optional[int] = Query(None, ge=0),
+    heartbeat: bool = Query(False)
 ):
+    """
+    Socket de messagerie. channels=chat,presence,broadcast multiplexe les trois
+    canaux sur ce seul socket (un socket par client au lieu de deux)
+    """
+    # Pas de session pour toute la durée du socket : chaque trame emprunte une
+    # connexion au pool le temps de son traitement puis la rend immédiatement
+    connection = None
     try:
+        try:
+            channel_set = parse_channels(channels)
+        except ValueError as e:
+            await websocket.close(code=4002, reason=str(e))
+            return
+
         # Authentifier l'utilisateur via le token
-        current_user = await get_user_from_token(token, session)
+        async with async_session() as session:
+            current_user = await get_user_from_token(token, session)
         if not current_user:
             await websocket.close(code=4001, reason="Token invalide")
             return
 
         # Connecter l'utilisateur
-        await manager.connect(websocket, current_user.id)
+        connection = await registry.connect(websocket, current_user.id, channel_set, binary=binary, heartbeat=heartbeat)
 
-        try:
-            while True:
-                # Écouter les messages du client
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
-                
-                # Traitement des différents types de messages
-                if message_data.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
-                
-                elif message_data.get("type") == "send_message":
-                    # Envoyer un message via WebSocket
-                    receiver_id = message_data.get("receiver_id")
-                    content = message_data.get("content")
-                    
-                    if not receiver_id or not content:
-                        await websocket.send_text(json.dumps({
-                            "type": "error",
-                            "message": "receiver_id et content requis"
-                        }))
-                        continue
-                    
-                    # Vérifier que le destinataire existe
-                    receiver = session.get(User, receiver_id)
-                    if not receiver:
-                        await websocket.send_text(json.dumps({
-                            "type": "error",
-                            "message": "Utilisateur destinataire non trouvé"
-                        }))
-                        continue
-                    
-                    # Créer le message en base
-                    message = Message(
-                        content=content,
-                        sender_id=current_user.id,
-                        receiver_id=receiver_id
-                    )
-                    session.add(message)
-                    session.commit()
-                    session.refresh(message)
-                    
-                    # Diffuser le message via WebSocket
-                    message_dict = {
-                        "type": "new_message",
-                        "id": message.id,
-                        "content": message.content,
-                        "sender_id": message.sender_id,
-                        "receiver_id": message.receiver_id,
-                        "created_at": message.created_at.isoformat() if message.created_at else None
-                    }
-                    
-                    await manager.send_message_to_conversation(
-                        message_dict, current_user.id, receiver_id
-                    )
-
-        except WebSocketDisconnect:
-            manager.disconnect(websocket, current_user.id)
+        if PRESENCE in channel_set:
+            connection.send(encode_event(registry.active_users_event()))
+
+        # Reprise après coupure : connecté d'abord pour ne rien perdre du direct,
+        # un événement peut donc arriver deux fois (dédoublonner par seq)
+        if CHAT in channel_set and resume_from is not None:
+            await replay_changes(connection, current_user.id, resume_from)
+
+        await registry.serve(connection, current_user)
             
     except Exception as e:
         print(f"Erreur WebSocket: {e}")
+        if connection:
+            registry.disconnect(connection)
         await websocket.close(code=4000, reason="Erreur serveur")
 
 # --- Envoyer un message (HTTP) ---
@@ -136,80 +264,235 @@ async def websocket_endpoint(
 async def send_message(
     receiver_id: int,
     content: str,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    receiver = session.get(User, receiver_id)
+    receiver = await session.get(User, receiver_id)
     if not receiver:
         raise HTTPException(status_code=404, detail="Utilisateur destinataire non trouvé")
     
     message = Message(
         content=content,
         sender_id=current_user.id,
-        receiver_id=receiver_id
+        receiver_id=receiver_id,
+        conversation_key=make_conversation_key(current_user.id, receiver_id)
     )
+    # Rendre la connexion au pool avant d'attendre le lot : sinon, sous charge, les requêtes
+    # en attente occupent tout le pool et l'écrivain ne peut plus obtenir de connexion
+    await session.close()
     
-    session.add(message)
-    session.commit()
-    session.refresh(message)
+    # Même chemin d'écriture que le WebSocket : le résumé de conversation est mis à jour
+    # dans le commit du lot, par une seule tâche (pas de création concurrente des résumés)
+    message, event = await message_writer.submit(message)
     
     # Diffuser le message via WebSocket
-    message_dict = {
-        "type": "new_message",
-        "id": message.id,
-        "content": message.content,
-        "sender_id": message.sender_id,
-        "receiver_id": message.receiver_id,
-        "created_at": message.created_at.isoformat() if message.created_at else None
-    }
-    
-    await manager.send_message_to_conversation(
-        message_dict, current_user.id, receiver_id
-    )
+    await send_message_to_conversation(event, current_user.id, receiver_id)
     
     return message
 
+# --- Envoyer plusieurs messages en une requête ---
+@router.post("/batch", response_model=MessageBatchPage)
+async def send_message_batch(
+    batch: MessageBatch,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Chaque élément est validé séparément (erreur par élément, à sa position) ;
+    les éléments valides sont écrits ensemble, dans un seul commit, puis diffusés
+    """
+    if len(batch.messages) > MESSAGE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Un lot compte au plus {MESSAGE_BATCH_MAX} messages")
+
+    results = [MessageBatchResult(index=index, status=200) for index in range(len(batch.messages))]
+    items: List[Optional[MessageBatchItem]] = []
+    for result, raw in zip(results, batch.messages):
+        try:
+            item = MessageBatchItem.model_validate(raw)
+        except ValidationError as e:
+            item = None
+            result.status, result.error = 422, "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'message'}: {error['msg']}"
+                for error in e.errors()
+            )
+        else:
+            if not item.content.strip():
+                item = None
+                result.status, result.error = 422, "content ne peut pas être vide"
+        items.append(item)
+
+    # Destinataires vérifiés par une seule requête IN, groupes par le cache des membres
+    receiver_ids = {item.receiver_id for item in items if item is not None and item.receiver_id is not None}
+    existing = set()
+    if receiver_ids:
+        existing = set((await session.exec(select(User.id).where(User.id.in_(receiver_ids)))).all())
+    await session.close()
+
+    accepted = []
+    for result, item in zip(results, items):
+        if item is None:
+            continue
+        if (item.receiver_id is None) == (item.conversation_id is None):
+            result.status, result.error = 400, "receiver_id ou conversation_id requis (un seul des deux)"
+        elif item.conversation_id is not None:
+            if await is_member(item.conversation_id, current_user.id):
+                accepted.append((result, Message(
+                    content=item.content,
+                    sender_id=current_user.id,
+                    conversation_id=item.conversation_id,
+                    conversation_key=group_conversation_key(item.conversation_id)
+                )))
+            else:
+                result.status, result.error = 404, "Groupe non trouvé"
+        elif item.receiver_id in existing:
+            accepted.append((result, Message(
+                content=item.content,
+                sender_id=current_user.id,
+                receiver_id=item.receiver_id,
+                conversation_key=make_conversation_key(current_user.id, item.receiver_id)
+            )))
+        else:
+            result.status, result.error = 404, "Utilisateur destinataire non trouvé"
+
+    if accepted:
+        written = await message_writer.submit_many([message for _, message in accepted])
+        for (result, _), (message, _) in zip(accepted, written):
+            result.message = message
+        # Diffusions publiées ensemble plutôt qu'une à une
+        await asyncio.gather(*(
+            send_message_to_conversation(event, message.sender_id, message.receiver_id, message.conversation_id)
+            for message, event in written
+        ))
+
+    return MessageBatchPage(items=results, sent=len(accepted), failed=len(results) - len(accepted))
+
 # --- Récupérer les messages de l'utilisateur connecté ---
-@router.get("/", response_model=List[Message])
-def get_my_messages(
-    session: Session = Depends(get_session),
+@router.get("/", response_model=MessagePage)
+async def get_my_messages(
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    messages = session.exec(
-        select(Message).where(
-            (Message.sender_id == current_user.id) | (Message.receiver_id == current_user.id)
-        ).order_by(Message.created_at)
-    ).all()
-    return messages
+    return await paginate_messages(session, visible_messages(current_user.id), before, after, limit)
+
+# --- Export complet de l'historique (flux) ---
+@router.get("/export")
+async def export_my_messages(
+    format: str = Query("ndjson", description="ndjson ou csv"),
+    current_user: User = Depends(get_current_user)
+):
+    """Tout l'historique de l'utilisateur, envoyé au fil de la lecture (mémoire constante)"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format inconnu : {format} (ndjson ou csv)")
+    return StreamingResponse(
+        export_messages(current_user.id, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="messages-{current_user.id}.{format}"'}
+    )
 
 # --- Récupérer la conversation avec un autre utilisateur ---
-@router.get("/conversation/{user_id}", response_model=List[Message])
-def get_conversation(
+@router.get("/conversation/{user_id}", response_model=MessagePage)
+async def get_conversation(
     user_id: int,
-    session: Session = Depends(get_session),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    other_user = session.get(User, user_id)
+    other_user = await session.get(User, user_id)
     if not other_user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
-    messages = session.exec(
-        select(Message).where(
-            ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id)) |
-            ((Message.sender_id == user_id) & (Message.receiver_id == current_user.id))
-        ).order_by(Message.created_at)
-    ).all()
-    return messages
+    return await paginate_messages(
+        session,
+        Message.conversation_key == make_conversation_key(current_user.id, user_id),
+        before, after, limit
+    )
+
+# --- Boîte de réception : une ligne par conversation ---
+@router.get("/conversations", response_model=List[ConversationSummary])
+async def get_conversations(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    query = (
+        select(ConversationSummary)
+        .where(ConversationSummary.user_id == current_user.id)
+        .order_by(ConversationSummary.last_message_at.desc(), ConversationSummary.id.desc())
+        .limit(limit)
+    )
+    return (await session.exec(query)).all()
+
+# --- Accusé de lecture : remet à zéro les non lus d'une conversation ---
+@router.post("/conversations/{user_id}/read", response_model=ConversationSummary)
+async def mark_conversation_read(
+    user_id: int,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    summary = await mark_read(session, current_user.id, make_conversation_key(current_user.id, user_id))
+    if not summary:
+        raise HTTPException(status_code=404, detail="Conversation non trouvée")
+    read_event = await log_event(session, {
+        "type": "conversation_read",
+        "user_id": current_user.id,
+        "other_user_id": user_id,
+        "last_read_message_id": summary.last_read_message_id
+    }, current_user.id, user_id)
+    await session.commit()
+
+    # Prévenir l'expéditeur et les autres appareils du lecteur
+    await send_message_to_conversation(read_event, current_user.id, user_id)
+
+    return summary
+
+# --- Recherche plein texte dans mes conversations ---
+@router.get("/search", response_model=SearchPage)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    user_id: Optional[int] = None,
+    conversation_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=1000),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Résultats classés par pertinence ; user_id (ou conversation_id pour un groupe) limite à une conversation"""
+    conversation_key = None
+    if conversation_id:
+        conversation_key = group_conversation_key(conversation_id)
+    elif user_id:
+        conversation_key = make_conversation_key(current_user.id, user_id)
+    # Un résultat de plus pour savoir s'il reste une page
+    hits = await search_messages(session, current_user.id, q, limit + 1, offset, conversation_key)
+    return SearchPage(
+        items=hits[:limit],
+        next_offset=offset + limit if len(hits) > limit else None
+    )
+
+# --- Resynchronisation : événements manqués depuis une séquence ---
+@router.get("/sync", response_model=SyncPage)
+async def sync_changes(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    return await fetch_changes(session, current_user.id, since, limit)
 
 # --- Update message ---
 @router.put("/{message_id}", response_model=Message)
 async def update_message(
     message_id: int,
     content: str,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    message = session.get(Message, message_id)
+    message = await session.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message non trouvé")
     if message.sender_id != current_user.id:
@@ -217,21 +500,23 @@ async def update_message(
     
     message.content = content
     session.add(message)
-    session.commit()
-    session.refresh(message)
-    
-    # Diffuser la mise à jour via WebSocket
-    update_dict = {
+    await message_edited(session, message)
+    await reindex_message(session, message)
+    update_dict = await log_event(session, {
         "type": "message_updated",
         "id": message.id,
         "content": message.content,
         "sender_id": message.sender_id,
         "receiver_id": message.receiver_id,
+        "conversation_id": message.conversation_id,
         "updated_at": datetime.now().isoformat()
-    }
+    }, message.sender_id, message.receiver_id, message.id, message.conversation_id)
+    await session.commit()
+    await session.refresh(message)
     
-    await manager.send_message_to_conversation(
-        update_dict, message.sender_id, message.receiver_id
+    # Diffuser la mise à jour via WebSocket
+    await send_message_to_conversation(
+        update_dict, message.sender_id, message.receiver_id, message.conversation_id
     )
     
     return message
@@ -240,35 +525,39 @@ async def update_message(
 @router.delete("/{message_id}")
 async def delete_message(
     message_id: int,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    message = session.get(Message, message_id)
+    message = await session.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message non trouvé")
     if message.sender_id != current_user.id:
         raise HTTPException(status_code=403, detail="Vous n'êtes pas autorisé à supprimer ce message")
     
     receiver_id = message.receiver_id
+    conversation_id = message.conversation_id
     
-    session.delete(message)
-    session.commit()
-    
-    # Diffuser la suppression via WebSocket
-    delete_dict = {
+    await session.delete(message)
+    await session.flush()
+    await message_deleted(session, message)
+    await unindex_message(session, message_id)
+    delete_dict = await log_event(session, {
         "type": "message_deleted",
         "id": message_id,
         "sender_id": current_user.id,
-        "receiver_id": receiver_id
-    }
+        "receiver_id": receiver_id,
+        "conversation_id": conversation_id
+    }, current_user.id, receiver_id, message_id, conversation_id)
+    await session.commit()
     
-    await manager.send_message_to_conversation(
-        delete_dict, current_user.id, receiver_id
+    # Diffuser la suppression via WebSocket
+    await send_message_to_conversation(
+        delete_dict, current_user.id, receiver_id, conversation_id
     )
     
     return {"message": "Message supprimé avec succès"}
 
 # --- Obtenir la liste des utilisateurs connectés ---
 @router.get("/online-users", response_model=List[int])
-def get_online_users(current_user: User = Depends(get_current_user)):
-    return list(manager.active_connections.keys())
\ No newline at end of file
+async def get_online_users(current_user: User = Depends(get_current_user)):
+    return registry.connected_users()
\ No newline at end of file
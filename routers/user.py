@@ -1,208 +1,104 @@
-from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
-from typing import List, Dict, Set
-from sqlmodel import Session, select
-from datetime import datetime, timedelta
-import json
-import asyncio
-from database import get_session
-from models import User, UserCreate, UserRead
-from routers.auth import get_current_user, get_user_from_token
+from fastapi import APIRouter, HTTPException, Depends, Header, WebSocket, Query
+from typing import Optional
+from sqlmodel import select
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import datetime
+import os
+from database import get_session, async_session
+from connection import ClientConnection
+from presence import ONLINE
+from registry import BROADCAST, PRESENCE, parse_channels, registry
+from serialization import encode_event, etag_response, rows_to_dicts
+from models import User, UserBatch, UserCreate, UserPage, UserRead
+from routers.auth import get_current_user, get_user_from_token, invalidate_user
+from routers.message import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
-# Store des connexions WebSocket actives
-class ConnectionManager:
-    def __init__(self):
-        # Dictionnaire : user_id -> Set[WebSocket]
-        self.active_connections: Dict[int, Set[WebSocket]] = {}
-        # Dictionnaire pour stocker la dernière activité : user_id -> datetime
-        self.last_activity: Dict[int, datetime] = {}
-        # Seuil d'inactivité en secondes (par exemple 5 minutes)
-        self.inactivity_threshold = 300
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Connecte un utilisateur via WebSocket"""
-        await websocket.accept()
-        
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = set()
-        
-        self.active_connections[user_id].add(websocket)
-        self.last_activity[user_id] = datetime.now()
-        
-        # Notifier tous les autres utilisateurs que cet utilisateur est maintenant actif
-        await self.broadcast_user_status(user_id, "online")
-
-    async def disconnect(self, websocket: WebSocket, user_id: int):
-        """Déconnecte un utilisateur"""
-        if user_id in self.active_connections:
-            self.active_connections[user_id].discard(websocket)
-            
-            # Si plus aucune connexion active pour cet utilisateur
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-                if user_id in self.last_activity:
-                    del self.last_activity[user_id]
-                
-                # Notifier que l'utilisateur est offline
-                await self.broadcast_user_status(user_id, "offline")
-
-    async def update_activity(self, user_id: int):
-        """Met à jour la dernière activité d'un utilisateur"""
-        if user_id in self.active_connections:
-            self.last_activity[user_id] = datetime.now()
-
-    def is_user_active(self, user_id: int) -> bool:
-        """Vérifie si un utilisateur est actif"""
-        if user_id not in self.active_connections:
-            return False
-        
-        if user_id not in self.last_activity:
-            return False
-        
-        time_since_activity = datetime.now() - self.last_activity[user_id]
-        return time_since_activity.total_seconds() < self.inactivity_threshold
-
-    def get_active_users(self) -> List[int]:
-        """Retourne la liste des utilisateurs actifs"""
-        active_users = []
-        current_time = datetime.now()
-        
-        for user_id, last_activity in self.last_activity.items():
-            if user_id in self.active_connections:
-                time_since_activity = current_time - last_activity
-                if time_since_activity.total_seconds() < self.inactivity_threshold:
-                    active_users.append(user_id)
-        
-        return active_users
-
-    async def send_personal_message(self, message: str, user_id: int):
-        """Envoie un message à un utilisateur spécifique"""
-        if user_id in self.active_connections:
-            disconnected_websockets = set()
-            
-            for websocket in self.active_connections[user_id].copy():
-                try:
-                    await websocket.send_text(message)
-                except:
-                    disconnected_websockets.add(websocket)
-            
-            # Nettoyer les connexions fermées
-            for ws in disconnected_websockets:
-                self.active_connections[user_id].discard(ws)
-
-    async def broadcast_user_status(self, user_id: int, status: str):
-        """Diffuse le statut d'un utilisateur à tous les autres utilisateurs connectés"""
-        message = json.dumps({
-            "type": "user_status",
-            "user_id": user_id,
-            "status": status,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Envoyer à tous les utilisateurs connectés sauf l'utilisateur concerné
-        for connected_user_id, websockets in self.active_connections.items():
-            if connected_user_id != user_id:
-                disconnected_websockets = set()
-                
-                for websocket in websockets.copy():
-                    try:
-                        await websocket.send_text(message)
-                    except:
-                        disconnected_websockets.add(websocket)
-                
-                # Nettoyer les connexions fermées
-                for ws in disconnected_websockets:
-                    websockets.discard(ws)
+router = APIRouter(tags=["Utilisateurs"])
 
-    async def broadcast_to_all(self, message: str):
-        """Diffuse un message à tous les utilisateurs connectés"""
-        for user_id, websockets in self.active_connections.items():
-            disconnected_websockets = set()
-            
-            for websocket in websockets.copy():
-                try:
-                    await websocket.send_text(message)
-                except:
-                    disconnected_websockets.add(websocket)
-            
-            # Nettoyer les connexions fermées
-            for ws in disconnected_websockets:
-                websockets.discard(ws)
+# Nombre maximal d'ids par requête GET /user/batch
+USER_BATCH_MAX = int(os.getenv("USER_BATCH_MAX", "200"))
 
-# Instance globale du gestionnaire de connexions
-manager = ConnectionManager()
+# Borne haute des plages de préfixe (plus grand point de code)
+PREFIX_END = "\U0010ffff"
 
-router = APIRouter(tags=["Utilisateurs"])
+async def handle_presence_frame(connection: ClientConnection, user: User, message_data: dict) -> bool:
+    """Trames entrantes du canal presence"""
+    if message_data.get("type") == "get_active_users":
+        # Demande de la liste des utilisateurs actifs
+        connection.send(encode_event(registry.active_users_event()))
+    
+    elif message_data.get("type") in ("subscribe_presence", "unsubscribe_presence"):
+        user_ids = message_data.get("user_ids")
+        if not isinstance(user_ids, list) or not all(isinstance(user_id, int) for user_id in user_ids):
+            connection.send(encode_event({
+                "type": "error",
+                "message": "user_ids doit être une liste d'identifiants"
+            }))
+        elif message_data["type"] == "subscribe_presence":
+            connection.send(encode_event({
+                "type": "presence_snapshot",
+                "users": registry.subscribe(connection, user_ids)
+            }))
+        else:
+            registry.unsubscribe(connection, user_ids)
+
+    elif message_data.get("type") == "activity_update":
+        # Simple mise à jour d'activité (déjà comptée à la réception de la trame)
+        pass
+
+    else:
+        return False
+    return True
+
+registry.add_frame_handler(PRESENCE, handle_presence_frame)
 
 # Routes WebSocket
 @router.websocket("/ws/{token}")
-async def websocket_endpoint(websocket: WebSocket, token: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    token: str,
+    channels: str = Query(f"{PRESENCE},{BROADCAST}"),
+    binary: bool = Query(False),
+    heartbeat: bool = Query(False)
+):
     """Point d'entrée WebSocket pour la gestion d'activité des utilisateurs"""
-    user = None
+    connection = None
     try:
+        try:
+            channel_set = parse_channels(channels)
+        except ValueError as e:
+            await websocket.close(code=4002, reason=str(e))
+            return
+
         # Créer une session pour la vérification du token
-        from database import engine
-        with Session(engine) as session:
+        async with async_session() as session:
             # Vérifier le token et récupérer l'utilisateur
-            user = get_user_from_token(token, session)
+            user = await get_user_from_token(token, session)
             if not user:
                 await websocket.close(code=4001)
                 return
         
-        await manager.connect(websocket, user.id)
+        connection = await registry.connect(websocket, user.id, channel_set, binary=binary, heartbeat=heartbeat)
         
         # Envoyer la liste des utilisateurs actifs au nouvel utilisateur connecté
-        active_users = manager.get_active_users()
-        await websocket.send_text(json.dumps({
-            "type": "active_users",
-            "users": active_users,
-            "timestamp": datetime.now().isoformat()
-        }))
+        if PRESENCE in channel_set:
+            connection.send(encode_event(registry.active_users_event()))
         
-        try:
-            while True:
-                # Recevoir des messages du client
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
-                
-                # Mettre à jour l'activité de l'utilisateur
-                await manager.update_activity(user.id)
-                
-                # Traiter différents types de messages
-                if message_data.get("type") == "ping":
-                    # Simple ping pour maintenir la connexion active
-                    await websocket.send_text(json.dumps({
-                        "type": "pong",
-                        "timestamp": datetime.now().isoformat()
-                    }))
-                
-                elif message_data.get("type") == "get_active_users":
-                    # Demande de la liste des utilisateurs actifs
-                    active_users = manager.get_active_users()
-                    await websocket.send_text(json.dumps({
-                        "type": "active_users",
-                        "users": active_users,
-                        "timestamp": datetime.now().isoformat()
-                    }))
-                
-                elif message_data.get("type") == "activity_update":
-                    # Simple mise à jour d'activité
-                    await manager.update_activity(user.id)
-        
-        except WebSocketDisconnect:
-            if user:
-                await manager.disconnect(websocket, user.id)
+        await registry.serve(connection, user)
     
     except Exception as e:
         print(f"Erreur WebSocket: {e}")
-        if user:
-            await manager.disconnect(websocket, user.id)
+        if connection:
+            registry.disconnect(connection)
         await websocket.close(code=4000)
 
 # Routes REST existantes - CORRIGÉES
 @router.post("/", response_model=UserRead)
-def create_user(user: UserCreate, session: Session = Depends(get_session)):
+async def create_user(user: UserCreate, session: AsyncSession = Depends(get_session)):
     # Vérifier si l'email existe déjà
-    existing_user = session.exec(select(User).where(User.email == user.email)).first()
+    existing_user = (await session.exec(select(User).where(User.email == user.email))).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email déjà existant")
     
@@ -213,20 +109,52 @@ def create_user(user: UserCreate, session: Session = Depends(get_session)):
         password=user.password  # Assurez-vous de hasher le mot de passe si nécessaire
     )
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     return db_user
 
-@router.get("/", response_model=List[UserRead])
-def read_users(session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    users = session.exec(select(User)).all()
-    return users
+def prefix_match(column, prefix: str):
+    """column commence par prefix, sans casse : une plage sur l'index lower(column)"""
+    key = func.lower(column)
+    start = func.lower(prefix)
+    return (key >= start) & (key < start + PREFIX_END)
+
+@router.get("/", response_model=UserPage)
+async def read_users(
+    q: Optional[str] = Query(None, min_length=1, max_length=100, description="Début du nom ou de l'email"),
+    after: Optional[int] = Query(None, ge=0, description="Curseur : dernier id de la page précédente"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Annuaire paginé par id croissant, filtré par préfixe ; 304 si la page n'a pas changé"""
+    # Seulement les colonnes de UserRead, en tuples : ni objets User ni revalidation
+    query = select(User.id, User.name, User.email).order_by(User.id)
+    if q:
+        query = query.where(prefix_match(User.name, q) | prefix_match(User.email, q))
+        if after is not None:
+            # "id + 0" : le curseur ne doit pas attirer le planificateur vers un parcours
+            # de la clé primaire, très lent pour un préfixe rare ; les plages des index
+            # lower() restent le point d'entrée
+            query = query.where(User.id + 0 > after)
+    elif after is not None:
+        query = query.where(User.id > after)
+
+    # Un élément de plus pour savoir s'il reste des utilisateurs
+    rows = list((await session.exec(query.limit(limit + 1))).all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return etag_response({
+        "items": rows_to_dicts(rows),
+        "after": rows[-1].id if has_more else None
+    }, if_none_match)
 
 
 
 @router.put("/me", response_model=UserRead)
-def update_current_user(user: UserCreate, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    db_user = session.get(User, current_user.id)
+async def update_current_user(user: UserCreate, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    db_user = await session.get(User, current_user.id)
     if not db_user:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
     
@@ -235,14 +163,44 @@ def update_current_user(user: UserCreate, session: Session = Depends(get_session
         setattr(db_user, key, value)
     
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail="Email déjà existant")
+    finally:
+        # Même en cas d'échec : aucune copie en cache ne doit survivre à une écriture
+        await invalidate_user(current_user.id)
+    await session.refresh(db_user)
     return db_user
 
 
+# Déclarée avant /{user_id}, qui capturerait sinon "batch"
+@router.get("/batch", response_model=UserBatch)
+async def read_users_batch(
+    ids: str = Query(..., description="Identifiants séparés par des virgules : 1,2,3"),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Plusieurs utilisateurs en une seule requête IN ; les ids inconnus sont listés dans missing"""
+    try:
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in ids.split(",") if user_id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids doit être une liste d'entiers séparés par des virgules")
+    if not user_ids:
+        raise HTTPException(status_code=400, detail="ids est vide")
+    if len(user_ids) > USER_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Au plus {USER_BATCH_MAX} ids par requête")
+
+    users = {user.id: user for user in (await session.exec(select(User).where(User.id.in_(user_ids)))).all()}
+    return UserBatch(
+        items=[users[user_id] for user_id in user_ids if user_id in users],
+        missing=[user_id for user_id in user_ids if user_id not in users]
+    )
+
 @router.get("/{user_id}", response_model=UserRead)
-def read_user(user_id: int, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    user = session.get(User, user_id)
+async def read_user(user_id: int, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
     return user
@@ -251,7 +209,7 @@ def read_user(user_id: int, session: Session = Depends(get_session), current_use
 @router.get("/active/list")
 async def get_active_users(current_user: User = Depends(get_current_user)):
     """Retourne la liste des utilisateurs actuellement actifs"""
-    active_user_ids = manager.get_active_users()
+    active_user_ids = registry.online_users()
     return {
         "active_users": active_user_ids,
         "count": len(active_user_ids),
@@ -261,10 +219,11 @@ async def get_active_users(current_user: User = Depends(get_current_user)):
 @router.get("/active/status/{user_id}")
 async def check_user_activity(user_id: int, current_user: User = Depends(get_current_user)):
     """Vérifie si un utilisateur spécifique est actif"""
-    is_active = manager.is_user_active(user_id)
+    status = registry.user_status(user_id)
     return {
         "user_id": user_id,
-        "is_active": is_active,
+        "is_active": status == ONLINE,
+        "status": status,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -277,23 +236,5 @@ async def broadcast_message(message: dict, current_user: User = Depends(get_curr
         "message": message.get("message", ""),
         "timestamp": datetime.now().isoformat()
     }
-    await manager.broadcast_to_all(json.dumps(broadcast_data))
-    return {"status": "Message diffusé", "recipients": len(manager.active_connections)}
-
-# Tâche en arrière-plan pour nettoyer les connexions inactives
-async def cleanup_inactive_connections():
-    """Nettoie périodiquement les connexions inactives"""
-    while True:
-        await asyncio.sleep(60)  # Vérifie toutes les minutes
-        
-        current_time = datetime.now()
-        inactive_users = []
-        
-        for user_id, last_activity in manager.last_activity.items():
-            time_since_activity = current_time - last_activity
-            if time_since_activity.total_seconds() > manager.inactivity_threshold:
-                inactive_users.append(user_id)
-        
-        # Marquer les utilisateurs inactifs comme offline
-        for user_id in inactive_users:
-            await manager.broadcast_user_status(user_id, "inactive")
\ No newline at end of file
+    await registry.publish(BROADCAST, broadcast_data)
+    return {"status": "Message diffusé", "recipients": len(registry.connections)}
@@ -0,0 +1,120 @@
+"""
+Recherche plein texte dans les messages.
+
+SQLite : table virtuelle FTS5 message_fts (rowid = id du message), alimentée
+par les mêmes chemins que les messages (écriture groupée, modification,
+suppression). PostgreSQL : index GIN sur to_tsvector('simple', content),
+toujours à jour sans écriture supplémentaire. Dans les deux cas la recherche
+passe par l'index inversé : sa durée dépend du nombre de résultats, pas du
+volume total de messages.
+"""
+import re
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy import column, func, literal_column, table, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_session, is_sqlite
+from memberships import visible_messages
+from models import Message, SearchHit
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_WORDS = 12
+
+message_fts = table("message_fts", column("rowid"), column("content"))
+
+
+async def create_search_index():
+    """Crée l'index plein texte s'il manque (et l'alimente avec les messages existants)"""
+    async with async_session() as session:
+        if is_sqlite:
+            exists = (await session.exec(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'")
+            )).first()
+            if exists:
+                return
+            await session.exec(text(
+                "CREATE VIRTUAL TABLE message_fts USING fts5(content, tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+            await session.exec(text("INSERT INTO message_fts (rowid, content) SELECT id, content FROM message"))
+        else:
+            await session.exec(text(
+                "CREATE INDEX IF NOT EXISTS ix_message_content_fts "
+                "ON message USING gin (to_tsvector('simple', content))"
+            ))
+        await session.commit()
+
+
+async def index_messages(session: AsyncSession, messages: List[Message]):
+    """Indexe des messages déjà flushés (commit à la charge de l'appelant)"""
+    if is_sqlite and messages:
+        await session.exec(
+            text("INSERT INTO message_fts (rowid, content) VALUES (:id, :content)"),
+            params=[{"id": message.id, "content": message.content} for message in messages]
+        )
+
+
+async def reindex_message(session: AsyncSession, message: Message):
+    if is_sqlite:
+        await session.exec(
+            text("UPDATE message_fts SET content = :content WHERE rowid = :id"),
+            params={"id": message.id, "content": message.content}
+        )
+
+
+async def unindex_message(session: AsyncSession, message_id: int):
+    if is_sqlite:
+        await session.exec(text("DELETE FROM message_fts WHERE rowid = :id"), params={"id": message_id})
+
+
+def fts_query(q: str) -> str:
+    """
+    Requête FTS5 sûre à partir de la saisie : chaque mot entre guillemets
+    (pas d'opérateurs injectés), le dernier en préfixe pour la recherche à la frappe
+    """
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Requête de recherche vide")
+    return " ".join(f'"{term}"' for term in terms) + "*"
+
+
+async def search_messages(
+    session: AsyncSession,
+    user_id: int,
+    q: str,
+    limit: int,
+    offset: int = 0,
+    conversation_key: Optional[str] = None
+) -> List[SearchHit]:
+    """Messages de l'utilisateur correspondant à q, les plus pertinents d'abord"""
+    if is_sqlite:
+        fts = literal_column("message_fts")
+        # bm25 : plus petit = plus pertinent ; inversé pour un score croissant
+        score = -func.bm25(fts)
+        snippet = func.snippet(fts, 0, SNIPPET_START, SNIPPET_END, "…", SNIPPET_WORDS)
+        query = (
+            select(Message, snippet, score)
+            .select_from(message_fts)
+            .join(Message, Message.id == message_fts.c.rowid)
+            .where(fts.op("MATCH")(fts_query(q)))
+        )
+    else:
+        document = func.to_tsvector(literal_column("'simple'"), Message.content)
+        ts_query = func.websearch_to_tsquery(literal_column("'simple'"), q)
+        score = func.ts_rank(document, ts_query)
+        snippet = func.ts_headline(
+            literal_column("'simple'"), Message.content, ts_query,
+            f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS}"
+        )
+        query = select(Message, snippet, score).where(document.op("@@")(ts_query))
+
+    # Limité aux conversations de l'utilisateur (groupes compris)
+    query = query.where(visible_messages(user_id))
+    if conversation_key:
+        query = query.where(Message.conversation_key == conversation_key)
+
+    rows = (await session.exec(
+        query.order_by(score.desc(), Message.id.desc()).limit(limit).offset(offset)
+    )).all()
+    return [SearchHit(message=message, snippet=snippet, score=score) for message, snippet, score in rows]
@@ -0,0 +1,105 @@
+"""
+Encodage des événements WebSocket.
+
+Un événement est sérialisé une seule fois en Frame (bytes) puis la même Frame
+est réutilisée pour tous les sockets destinataires, y compris à travers le
+backplane. orjson est utilisé s'il est installé, sinon json de la stdlib.
+
+Les réponses HTTP de listes passent par le même encodeur (FastJSONResponse) :
+lignes SQL en tuples, sans objets ORM ni revalidation par response_model.
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle
+    orjson = None
+
+
+def _default(value):
+    # Même rendu que orjson pour les dates naïves
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} n'est pas sérialisable en JSON")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Frame:
+    """Événement pré-encodé, partagé entre tous les destinataires"""
+    __slots__ = ("data", "_text")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        # Décodé une seule fois pour les clients en trames texte
+        if self._text is None:
+            self._text = self.data.decode()
+        return self._text
+
+
+def encode_event(event: dict) -> Frame:
+    return Frame(dumps(event))
+
+
+def pack_envelope(header: dict, frame: Frame) -> bytes:
+    """Enveloppe backplane : en-tête JSON + saut de ligne + trame déjà encodée"""
+    return dumps(header) + b"\n" + frame.data
+
+
+def unpack_envelope(raw: bytes) -> Tuple[dict, Frame]:
+    header, _, data = raw.partition(b"\n")
+    return loads(header), Frame(data)
+
+
+def rows_to_dicts(rows: Sequence) -> List[dict]:
+    """Lignes d'un select de colonnes en dicts {colonne: valeur}"""
+    if not rows:
+        return []
+    keys = rows[0]._fields
+    return [dict(zip(keys, row)) for row in rows]
+
+
+class FastJSONResponse(Response):
+    """
+    Réponse JSON encodée directement par dumps. Renvoyée par une route, elle
+    court-circuite la validation du response_model (qui reste documenté dans
+    OpenAPI) : le contenu doit déjà avoir la forme annoncée
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def etag_response(content, if_none_match: Optional[str]) -> Response:
+    """
+    Réponse JSON avec un ETag calculé sur son contenu : 304 sans corps si le
+    client présente déjà cette version dans If-None-Match
+    """
+    body = dumps(content)
+    etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match:
+        # Comparaison faible : W/ ignoré des deux côtés
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or etag.removeprefix("W/") in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
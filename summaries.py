@@ -0,0 +1,176 @@
+"""
+Maintenance incrémentale des résumés de conversation (boîte de réception).
+
+Chaque conversation a une ligne ConversationSummary par participant : dernier
+message, aperçu, date et nombre de messages non lus. Les fonctions ci-dessous
+s'exécutent dans la transaction qui modifie les messages ; la liste des
+conversations se lit alors sans parcourir la table des messages. Pour un groupe,
+les lignes sont créées à l'entrée de chaque membre et un nouveau message les met
+toutes à jour en un seul UPDATE, quel que soit le nombre de membres.
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import case
+from sqlmodel import select, update, delete, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import ConversationSummary, Message, group_conversation_key
+
+PREVIEW_LENGTH = 100
+
+
+def _preview(content: str) -> str:
+    return content[:PREVIEW_LENGTH]
+
+
+def _last_message_values(message: Optional[Message]) -> dict:
+    if message is None:
+        return {
+            "last_message_id": None,
+            "last_sender_id": None,
+            "last_message_preview": None,
+            "last_message_at": None,
+        }
+    return {
+        "last_message_id": message.id,
+        "last_sender_id": message.sender_id,
+        "last_message_preview": _preview(message.content),
+        "last_message_at": message.created_at,
+    }
+
+
+def _pair(user_id: int, other_user_id: int):
+    return (ConversationSummary.user_id == user_id) & (ConversationSummary.other_user_id == other_user_id)
+
+
+async def record_messages(session: AsyncSession, messages: List[Message]):
+    """
+    Répercute de nouveaux messages (déjà flushés, donc avec un id) sur les résumés.
+    Un lot est agrégé par paire, ou par groupe : une seule mise à jour par conversation
+    et participant, ou par groupe.
+    """
+    # (user_id, other_user_id) -> [dernier message, nombre de nouveaux non lus]
+    changes: Dict[Tuple[int, int], list] = {}
+    # conversation_key du groupe -> [dernier message, messages du lot par expéditeur]
+    group_changes: Dict[str, list] = {}
+    for message in messages:
+        if message.conversation_id is not None:
+            change = group_changes.setdefault(message.conversation_key, [message, Counter()])
+            change[0] = message
+            change[1][message.sender_id] += 1
+            continue
+        sides = [(message.sender_id, message.receiver_id, 0)]
+        if message.receiver_id != message.sender_id:
+            sides.append((message.receiver_id, message.sender_id, 1))
+        for user_id, other_user_id, unread in sides:
+            change = changes.setdefault((user_id, other_user_id), [message, 0])
+            change[0] = message
+            change[1] += unread
+
+    for (user_id, other_user_id), (message, unread) in changes.items():
+        # Incrément côté SQL : pas de perte si un accusé de lecture passe entre-temps
+        result = await session.exec(
+            update(ConversationSummary)
+            .where(_pair(user_id, other_user_id))
+            .values(unread_count=ConversationSummary.unread_count + unread, **_last_message_values(message))
+        )
+        if result.rowcount == 0:
+            session.add(ConversationSummary(
+                user_id=user_id,
+                other_user_id=other_user_id,
+                conversation_key=message.conversation_key,
+                unread_count=unread,
+                **_last_message_values(message)
+            ))
+
+    for conversation_key, (message, by_sender) in group_changes.items():
+        # Non lus de chaque membre : les messages du lot qu'il n'a pas envoyés lui-même
+        unread = sum(by_sender.values()) - case(by_sender, value=ConversationSummary.user_id, else_=0)
+        await session.exec(
+            update(ConversationSummary)
+            .where(ConversationSummary.conversation_key == conversation_key)
+            .values(unread_count=ConversationSummary.unread_count + unread, **_last_message_values(message))
+        )
+
+
+async def member_joined(session: AsyncSession, conversation_id: int, user_ids: List[int]):
+    """Crée le résumé du groupe pour de nouveaux membres (à jour du dernier message, rien de non lu)"""
+    conversation_key = group_conversation_key(conversation_id)
+    last_message = (await session.exec(
+        select(Message)
+        .where(Message.conversation_key == conversation_key)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+    )).first()
+    session.add_all(
+        ConversationSummary(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            conversation_key=conversation_key,
+            last_read_message_id=last_message.id if last_message else None,
+            **_last_message_values(last_message)
+        )
+        for user_id in user_ids
+    )
+
+
+async def member_left(session: AsyncSession, conversation_id: int, user_id: int):
+    await session.exec(
+        delete(ConversationSummary)
+        .where(ConversationSummary.user_id == user_id)
+        .where(ConversationSummary.conversation_key == group_conversation_key(conversation_id))
+    )
+
+
+async def message_edited(session: AsyncSession, message: Message):
+    """Met à jour l'aperçu si le message modifié est le dernier de la conversation"""
+    await session.exec(
+        update(ConversationSummary)
+        .where(ConversationSummary.conversation_key == message.conversation_key)
+        .where(ConversationSummary.last_message_id == message.id)
+        .values(last_message_preview=_preview(message.content))
+    )
+
+
+async def message_deleted(session: AsyncSession, message: Message):
+    """Retire un message supprimé des compteurs et, si besoin, remonte au message précédent"""
+    # Encore non lu par les destinataires (l'autre participant, ou les autres membres) : un non lu de moins
+    await session.exec(
+        update(ConversationSummary)
+        .where(ConversationSummary.conversation_key == message.conversation_key)
+        .where(ConversationSummary.user_id != message.sender_id)
+        .where(ConversationSummary.unread_count > 0)
+        .where(or_(
+            ConversationSummary.last_read_message_id.is_(None),
+            ConversationSummary.last_read_message_id < message.id
+        ))
+        .values(unread_count=ConversationSummary.unread_count - 1)
+    )
+
+    previous = (await session.exec(
+        select(Message)
+        .where(Message.conversation_key == message.conversation_key, Message.id != message.id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+    )).first()
+    await session.exec(
+        update(ConversationSummary)
+        .where(ConversationSummary.conversation_key == message.conversation_key)
+        .where(ConversationSummary.last_message_id == message.id)
+        .values(**_last_message_values(previous))
+    )
+
+
+async def mark_read(session: AsyncSession, user_id: int, conversation_key: str) -> Optional[ConversationSummary]:
+    """Accusé de lecture : tout ce qui a été reçu jusqu'au dernier message est lu"""
+    condition = (ConversationSummary.user_id == user_id) & (ConversationSummary.conversation_key == conversation_key)
+    result = await session.exec(
+        update(ConversationSummary)
+        .where(condition)
+        .values(unread_count=0, last_read_message_id=ConversationSummary.last_message_id)
+    )
+    if result.rowcount == 0:
+        return None
+    return (await session.exec(
+        select(ConversationSummary).where(condition)
+        .execution_options(populate_existing=True)
+    )).first()
@@ -0,0 +1,130 @@
+"""Backend Redis du backplane, sur un faux serveur pub/sub en mémoire"""
+import asyncio
+import types
+
+import broadcast
+from broadcast import RedisBackend
+
+
+class FakeRedis:
+    """Un seul « serveur » partagé par tous les clients créés par from_url"""
+
+    def __init__(self):
+        self.subscriptions = []
+        self.publish_error = None
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    async def publish(self, channel, message):
+        if self.publish_error:
+            raise self.publish_error
+        for pubsub in list(self.subscriptions):
+            if channel in pubsub.channels:
+                pubsub.queue.put_nowait({"type": "message", "channel": channel.encode(), "data": message})
+
+    def drop_connections(self):
+        """Coupe toutes les connexions d'abonnement"""
+        for pubsub in self.subscriptions:
+            pubsub.queue.put_nowait(ConnectionError("Connection reset by peer"))
+
+    async def aclose(self):
+        pass
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.channels = set()
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+        self.server.subscriptions.append(self)
+
+    async def listen(self):
+        while True:
+            item = await self.queue.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def aclose(self):
+        if self in self.server.subscriptions:
+            self.server.subscriptions.remove(self)
+
+
+def make_workers(monkeypatch, count=2):
+    server = FakeRedis()
+    monkeypatch.setattr(broadcast, "aioredis", types.SimpleNamespace(from_url=lambda url: server))
+    monkeypatch.setattr(broadcast, "BROADCAST_RECONNECT_MIN", 0.01)
+    received = [[] for _ in range(count)]
+    backends = []
+    for inbox in received:
+        backend = RedisBackend("redis://fake")
+
+        async def handler(message, inbox=inbox):
+            if message == b"boom":
+                raise ValueError("handler en échec")
+            inbox.append(message)
+
+        backend.subscribe("events", handler)
+        backends.append(backend)
+    return server, backends, received
+
+
+def test_two_workers_share_events(monkeypatch):
+    async def scenario():
+        server, backends, received = make_workers(monkeypatch)
+        for backend in backends:
+            await backend.connect()
+
+        await backends[0].publish("events", b"hello")
+        # Un handler qui lève ne coupe pas la lecture des messages suivants
+        await backends[1].publish("events", b"boom")
+        await backends[1].publish("events", b"world")
+        await asyncio.sleep(0.01)
+        assert received == [[b"hello", b"world"], [b"hello", b"world"]]
+
+        for backend in backends:
+            await backend.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_reader_resubscribes_after_a_dropped_connection(monkeypatch):
+    async def scenario():
+        server, backends, received = make_workers(monkeypatch)
+        for backend in backends:
+            await backend.connect()
+
+        server.drop_connections()
+        await asyncio.sleep(0.05)
+        assert all(not backend.reader_task.done() for backend in backends)
+
+        await backends[0].publish("events", b"after")
+        await asyncio.sleep(0.01)
+        assert received == [[b"after"], [b"after"]]
+
+        for backend in backends:
+            await backend.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_publish_failure_is_not_fatal(monkeypatch):
+    async def scenario():
+        server, backends, received = make_workers(monkeypatch, count=1)
+        await backends[0].connect()
+
+        server.publish_error = ConnectionError("Redis indisponible")
+        assert await backends[0].publish("events", b"lost") is False
+
+        server.publish_error = None
+        assert await backends[0].publish("events", b"kept") is True
+        await asyncio.sleep(0.01)
+        assert received == [[b"kept"]]
+
+        await backends[0].disconnect()
+
+    asyncio.run(scenario())
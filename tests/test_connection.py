@@ -0,0 +1,86 @@
+"""File d'envoi d'une connexion face à un client lent"""
+import asyncio
+
+from connection import SLOW_CONSUMER_CLOSE_CODE, ClientConnection
+from serialization import encode_event
+
+
+class SlowWebSocket:
+    """Socket dont l'envoi reste bloqué tant que `release` n'est pas déclenché"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, text):
+        await self.release.wait()
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def chat(i):
+    return encode_event({"type": "new_message", "id": i})
+
+
+def presence(user_id, status):
+    return encode_event({"type": "user_status_changed", "user_id": user_id, "status": status})
+
+
+async def fill(connection, frames):
+    """Démarre l'écriture (bloquée sur la première trame) puis remplit la file"""
+    connection.start()
+    connection.send(frames[0])
+    await asyncio.sleep(0)
+    for frame in frames[1:]:
+        assert connection.send(frame)
+
+
+def test_default_policy_never_loses_a_chat_frame_silently():
+    async def scenario():
+        websocket = SlowWebSocket()
+        connection = ClientConnection(websocket, 1, queue_size=2)
+        await fill(connection, [chat(1), chat(2), chat(3)])
+
+        # File pleine : le message ne peut pas être gardé, le client doit le savoir
+        assert not connection.send(chat(4))
+        await connection.close_task
+        assert websocket.close_code == SLOW_CONSUMER_CLOSE_CODE
+        assert connection.closed
+
+    asyncio.run(scenario())
+
+
+def test_default_policy_drops_only_replaceable_frames():
+    async def scenario():
+        websocket = SlowWebSocket()
+        connection = ClientConnection(websocket, 1, queue_size=2)
+        await fill(connection, [chat(1), chat(2), chat(3)])
+
+        assert not connection.send(presence(7, "online"), key=("presence", 7))
+        assert connection.close_task is None
+        websocket.release.set()
+        connection.stop()
+
+    asyncio.run(scenario())
+
+
+def test_coalesce_replaces_the_queued_version():
+    async def scenario():
+        websocket = SlowWebSocket()
+        connection = ClientConnection(websocket, 1, queue_size=2, policy="coalesce")
+        connection.start()
+        connection.send(chat(1))
+        await asyncio.sleep(0)
+        connection.send(presence(7, "online"), key=("presence", 7))
+        connection.send(chat(2))
+
+        assert connection.send(presence(7, "away"), key=("presence", 7))
+        assert not connection.send(chat(3))
+        await connection.close_task
+        assert websocket.close_code == SLOW_CONSUMER_CLOSE_CODE
+        assert connection.queue.get_nowait()[0].text == presence(7, "away").text
+
+    asyncio.run(scenario())
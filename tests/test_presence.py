@@ -0,0 +1,81 @@
+"""Présence partagée entre plusieurs workers"""
+import asyncio
+
+from presence import IDLE, OFFLINE, ONLINE, ClusterPresence
+from registry import PRESENCE, ConnectionRegistry
+from serialization import loads
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(loads(text))
+
+    async def close(self, code=1000):
+        pass
+
+
+def test_cluster_status_keeps_the_most_active_worker():
+    now = [0.0]
+    cluster = ClusterPresence(ttl=30, clock=lambda: now[0])
+    cluster.update("a", 1, IDLE)
+    cluster.update("b", 1, ONLINE)
+    assert cluster.status(1) == ONLINE
+    assert cluster.status(1, local=OFFLINE) == ONLINE
+
+    cluster.update("b", 1, OFFLINE)
+    assert cluster.status(1) == IDLE
+    assert cluster.replace("a", {}) == {1}
+    assert cluster.status(1) == OFFLINE
+
+
+def test_silent_worker_is_forgotten():
+    now = [0.0]
+    cluster = ClusterPresence(ttl=30, clock=lambda: now[0])
+    cluster.update("a", 1, ONLINE)
+    now[0] = 20
+    cluster.replace("b", {2: ONLINE})
+    now[0] = 40
+    assert cluster.expire() == {1}
+    assert cluster.users() == {2}
+
+
+def test_user_stays_online_until_the_last_worker_disconnects():
+    async def scenario():
+        # Deux registres sur le même backplane : deux workers
+        first, second = ConnectionRegistry(), ConnectionRegistry()
+
+        watcher_socket = FakeWebSocket()
+        watcher = await first.connect(watcher_socket, 2, [PRESENCE])
+        first.subscribe(watcher, [1])
+
+        on_first = await first.connect(FakeWebSocket(), 1, [PRESENCE])
+        on_second = await second.connect(FakeWebSocket(), 1, [PRESENCE])
+        for registry in (first, second):
+            await registry.flush_statuses()
+        assert second.user_status(1) == ONLINE
+        assert 1 in second.online_users()
+
+        # Plus de socket sur le premier worker : toujours online grâce au second
+        first.disconnect(on_first)
+        await first.flush_statuses()
+        assert first.user_status(1) == ONLINE
+        assert 1 in first.connected_users()
+
+        second.disconnect(on_second)
+        await second.flush_statuses()
+        assert first.user_status(1) == OFFLINE
+        assert first.online_users() == [2]
+
+        await asyncio.sleep(0.01)
+        statuses = [event["status"] for event in watcher_socket.sent if event["type"] == "user_status"]
+        assert statuses == [ONLINE, OFFLINE]
+
+        first.disconnect(watcher)
+
+    asyncio.run(scenario())
@@ -0,0 +1,150 @@
+"""
+Écriture groupée (group commit) des messages reçus par WebSocket.
+
+Les messages de tous les sockets passent par une file unique ; une tâche
+d'écriture les insère par lots (au plus WRITE_BATCH_SIZE messages, ou après
+WRITE_BATCH_DELAY secondes) avec un seul commit par lot. Chaque appelant
+récupère son message, avec son id, et l'événement new_message journalisé
+(avec son seq) une fois le lot durable. Les messages soumis ensemble
+(submit_many) ne sont jamais répartis sur deux commits.
+"""
+import asyncio
+import os
+from typing import List, Tuple
+from database import async_session
+from models import Message
+from summaries import record_messages
+from changelog import log_new_messages
+from search import index_messages
+
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+WRITE_BATCH_DELAY = float(os.getenv("WRITE_BATCH_DELAY", "0.005"))
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))
+
+# Messages soumis ensemble, et le futur qui recevra leurs (message, événement)
+Pending = Tuple[List[Message], asyncio.Future]
+
+# Sentinelle de fin de file : arrêt propre de la tâche d'écriture
+STOP = object()
+
+
+class MessageWriter:
+    def __init__(
+        self,
+        batch_size: int = WRITE_BATCH_SIZE,
+        max_delay: float = WRITE_BATCH_DELAY,
+        queue_size: int = WRITE_QUEUE_SIZE
+    ):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        # File bornée : quand l'écriture ne suit plus, submit() attend (backpressure)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task = None
+        self.stopping = False
+
+    def start(self):
+        self.stopping = False
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Arrête la tâche d'écriture sans l'interrompre : une sentinelle en fin de file
+        lui fait écrire tout ce qui la précède, lot en cours compris
+        """
+        if self.task:
+            await self.queue.put(STOP)
+            await self.task
+            self.task = None
+        # Soumis après la sentinelle : ne seront jamais écrits
+        while not self.queue.empty():
+            pending = self.queue.get_nowait()
+            if pending is not STOP and not pending[1].done():
+                pending[1].set_exception(RuntimeError("Écriture des messages arrêtée"))
+
+    async def submit(self, message: Message) -> Tuple[Message, dict]:
+        """Met le message en file et attend que son lot soit commité"""
+        return (await self.submit_many([message]))[0]
+
+    async def submit_many(self, messages: List[Message]) -> List[Tuple[Message, dict]]:
+        """Met plusieurs messages en file ; ils sont écrits dans le même commit"""
+        if self.stopping:
+            raise RuntimeError("Écriture des messages arrêtée")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((messages, future))
+        return await future
+
+    def _add(self, batch: List[Pending], pending, count: int) -> int:
+        """Ajoute une entrée au lot ; la sentinelle termine la tâche après ce lot"""
+        if pending is STOP:
+            self.stopping = True
+            return count
+        batch.append(pending)
+        return count + len(pending[0])
+
+    def _drain(self, batch: List[Pending], count: int) -> int:
+        """Complète le lot avec les entrées déjà en file ; renvoie le nombre de messages"""
+        while count < self.batch_size and not self.stopping and not self.queue.empty():
+            count = self._add(batch, self.queue.get_nowait(), count)
+        return count
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self.stopping:
+            batch = []
+            count = self._drain(batch, self._add(batch, await self.queue.get(), 0))
+            deadline = loop.time() + self.max_delay
+            # Attendre d'autres messages jusqu'à remplir le lot ou atteindre le délai
+            while batch and count < self.batch_size and not self.stopping:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                count = self._drain(batch, self._add(batch, pending, count))
+            if batch:
+                await self._commit(batch)
+
+    async def _write(self, messages: List[Message]) -> List[dict]:
+        async with async_session() as session:
+            try:
+                session.add_all(messages)
+                # Un seul INSERT multi-lignes au flush, qui attribue les ids ;
+                # les résumés suivent dans le même commit
+                await session.flush()
+                await record_messages(session, messages)
+                await index_messages(session, messages)
+                events = await log_new_messages(session, messages)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        return events
+
+    async def _commit(self, batch: List[Pending]):
+        messages = [message for submitted, _ in batch for message in submitted]
+        try:
+            events = await self._write(messages)
+        except Exception as e:
+            if len(batch) > 1:
+                # Une entrée invalide ne doit pas faire échouer celles des autres
+                # utilisateurs : chaque entrée est réécrite seule
+                for pending in batch:
+                    await self._commit([pending])
+                return
+            print(f"Erreur écriture groupée ({len(messages)} messages): {e}")
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        results = iter(zip(messages, events))
+        for submitted, future in batch:
+            written = [next(results) for _ in submitted]
+            if not future.done():
+                future.set_result(written)
+
+
+# Instance globale
+message_writer = MessageWriter()